@@ -1,41 +1,22 @@
 import os
-import json
 from pathlib import Path
 from dotenv import load_dotenv
 
+from json_journal import JsonJournal
+
 load_dotenv()
 
 DB_DIR = Path(__file__).resolve().parent / "data"
 DB_PATH = DB_DIR / "aircraftDb.json"
 
-_aircraft_db = {}
+# Snapshot + append-only journal, see json_journal.py
+_store = JsonJournal(DB_PATH, "aircraft_cache")
+_aircraft_db = _store.data
 
 
 def _load_db():
     global _aircraft_db
-    if not DB_PATH.exists():
-        print("[aircraft_cache] No existing aircraftDb.json, starting with empty.")
-        _aircraft_db = {}
-        return
-
-    try:
-        with open(DB_PATH, "r", encoding="utf-8") as f:
-            _aircraft_db = json.load(f)
-        print(f"[aircraft_cache] Loaded {len(_aircraft_db)} aircraft from JSON cache.")
-    except Exception as e:
-        print(f"[aircraft_cache] Error reading aircraftDb.json, starting empty: {e}")
-        _aircraft_db = {}
-
-
-def _save_db():
-    global _aircraft_db
-    DB_DIR.mkdir(exist_ok=True)
-    try:
-        with open(DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(_aircraft_db, f, indent=2)
-        print(f"[aircraft_cache] Saved aircraftDb.json with {len(_aircraft_db)} entries.")
-    except Exception as e:
-        print(f"[aircraft_cache] Error writing aircraftDb.json: {e}")
+    _aircraft_db = _store.load()
 
 
 def get_all_aircraft():
@@ -79,8 +60,7 @@ def create_or_update_aircraft(record: dict):
         return False, "Missing 'registration' field."
 
     reg = reg.upper().strip()
-    _aircraft_db[reg] = record
-    _save_db()
+    _store.put(reg, record)
     return True, f"Aircraft {reg} saved/updated."
 
 
@@ -90,11 +70,7 @@ def delete_aircraft(reg: str):
     """
     global _aircraft_db
     reg = reg.upper().strip()
-    if reg in _aircraft_db:
-        del _aircraft_db[reg]
-        _save_db()
-        return True
-    return False
+    return _store.delete(reg)
 
 
 # Load DB once on import
@@ -1,41 +1,26 @@
 import os
-import json
 import requests
 from pathlib import Path
 from dotenv import load_dotenv
 
+import upstream
+import checkwx_quota
+from airport_snapshot import AirportSnapshotJournal
+
 load_dotenv()
 
 CHECKWX_API_KEY = os.getenv("CHECKWX_API_KEY")
 DB_DIR = Path(__file__).resolve().parent / "data"
-DB_PATH = DB_DIR / "airportDb.json"
+DB_PATH = DB_DIR / "airportDb.json"  # legacy snapshot, converted to SNAPSHOT_PATH on first load
+SNAPSHOT_PATH = DB_DIR / "airportDb.snap"
 
-_airport_db = {}
+# mmap'ed binary snapshot + append-only journal, see airport_snapshot.py / json_journal.py
+_store = AirportSnapshotJournal(DB_PATH, SNAPSHOT_PATH, "airport_cache")
+_airport_db = _store.data
 
 def _load_db():
     global _airport_db
-    if not DB_PATH.exists():
-        print("[airport_cache] No existing airportDb.json, starting with empty.")
-        _airport_db = {}
-        return
-
-    try:
-        with open(DB_PATH, "r", encoding="utf-8") as f:
-            _airport_db = json.load(f)
-        print(f"[airport_cache] Loaded {len(_airport_db)} airports from JSON cache.")
-    except Exception as e:
-        print(f"[airport_cache] Error reading airportDb.json, starting empty: {e}")
-        _airport_db = {}
-
-def _save_db():
-    global _airport_db
-    DB_DIR.mkdir(exist_ok=True)  # ensure folder exists
-    try:
-        with open(DB_PATH, "w", encoding="utf-8") as f:
-            json.dump(_airport_db, f, indent=2)
-        print(f"[airport_cache] Saved airportDb.json with {len(_airport_db)} entries.")
-    except Exception as e:
-        print(f"[airport_cache] Error writing airportDb.json: {e}")
+    _airport_db = _store.load()
 
 def _fetch_station_data(icao: str):
     """
@@ -64,7 +49,8 @@ def _fetch_station_data(icao: str):
     print(f"[airport_cache] _fetch_station_data: icao={icao}, URL={url}, KEY={masked_key}")
 
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        checkwx_quota.acquire()
+        resp = upstream.get("checkwx", url, headers=headers)
         print(f"[airport_cache]  CheckWX response: {resp.status_code}")
         resp.raise_for_status()
 
@@ -96,13 +82,17 @@ def get_airport_coords(icao: str):
 
     if icao in _airport_db:
         print(f"[airport_cache]  Found {icao} in local DB")
-        station = _airport_db[icao]
+        # Straight from the snapshot's lat/lon columns, no need to decode the whole record
+        coords = _airport_db.coords(icao)
+        if coords is None:
+            print(f"[airport_cache]  Missing lat/lon in stored record for {icao}.")
+            return None
+        return {"lat": coords[0], "lon": coords[1]}
     else:
         print(f"[airport_cache]  {icao} not in local DB; querying CheckWX.")
         station = _fetch_station_data(icao)
         if station:
-            _airport_db[icao] = station
-            _save_db()
+            _store.put(icao, station)
             print(f"[airport_cache]  => Stored new station record for {icao}")
         else:
             print(f"[airport_cache]  => Could NOT find station for {icao} (None returned)")
@@ -136,8 +126,7 @@ def get_airport_data(icao: str):
     print(f"[airport_cache]  {icao} not in local DB; querying CheckWX.")
     station = _fetch_station_data(icao)  # the function that calls /station/<icao>
     if station:
-        _airport_db[icao] = station
-        _save_db()
+        _store.put(icao, station)
         print(f"[airport_cache]  => Stored new station record for {icao}")
     else:
         print(f"[airport_cache]  => Could NOT find station for {icao} (None returned)")
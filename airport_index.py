@@ -0,0 +1,217 @@
+"""
+airport_index.py
+
+In-memory spatial index over the `airport` table for "which airports are
+near this position" questions.
+
+Airports are stored as 3D unit vectors in a KD-tree (scipy cKDTree), so a
+great-circle radius becomes a plain straight-line (chord) radius and there
+are no special cases at the poles or the antimeridian.
+
+The tree is built lazily from the table on first use. Airports inserted
+afterwards (through SQLAlchemy, in this process) are picked up via mapper
+events: they're collected on the session and, once it commits, go into a
+small pending list that is scanned brute-force and merged into the tree
+once it grows (a rollback just drops them). Updates/deletes, and rows
+inserted by other workers, are handled by a full rebuild (on the next query
+after a committed update/delete, and every REBUILD_MAX_AGE_SECONDS).
+"""
+
+import threading
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from geo import EARTH_RADIUS_KM, KM_PER_NM
+from models.airport import Airport
+
+# Merge pending inserts into the tree once there are this many
+MAX_PENDING = 64
+# Full rebuild from the table at least this often (picks up other workers' inserts)
+REBUILD_MAX_AGE_SECONDS = 600
+
+_tree = None
+_codes = np.empty(0, dtype=object)
+_names = np.empty(0, dtype=object)
+_latlon = np.empty((0, 2))
+_built_at = 0.0
+_dirty = True
+
+_pending = []  # [(icao, name, lat, lon)] inserted (and committed) since the last (re)build
+_index_lock = threading.Lock()
+
+# Session.info keys for changes that only count once the session commits
+_INFO_INSERTS = "airport_index_inserts"
+_INFO_DIRTY = "airport_index_dirty"
+
+
+def _to_xyz(lats, lons):
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _nm_to_chord(nm):
+    # Past half the circumference (~10,800 nm) the chord would shrink again; everything is within 2
+    angle = np.minimum(np.asarray(nm) * KM_PER_NM / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def _chord_to_nm(chord):
+    return 2 * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1)) * EARTH_RADIUS_KM / KM_PER_NM
+
+
+def _build(codes, names, latlon):
+    global _tree, _codes, _names, _latlon, _pending
+    _codes = np.asarray(codes, dtype=object)
+    _names = np.asarray(names, dtype=object)
+    _latlon = np.asarray(latlon, dtype=float).reshape(-1, 2)
+    _tree = cKDTree(_to_xyz(_latlon[:, 0], _latlon[:, 1])) if len(_codes) else None
+    _pending = []
+
+
+def _rebuild_from_db():
+    """
+    Full rebuild from the airport table (needs an app context). Caller holds _index_lock.
+    """
+    global _built_at, _dirty
+    rows = (
+        Airport.query
+        .with_entities(Airport.icao, Airport.name, Airport.latitude, Airport.longitude)
+        .filter(Airport.latitude.isnot(None), Airport.longitude.isnot(None))
+        .all()
+    )
+    _build([r[0] for r in rows], [r[1] for r in rows], [(r[2], r[3]) for r in rows])
+    _built_at = time.monotonic()
+    _dirty = False
+    print(f"[airport_index] Built spatial index with {len(rows)} airports.")
+
+
+def _merge_pending():
+    """
+    Fold the pending inserts into the tree (no DB access). Caller holds _index_lock.
+    """
+    known = set(_codes.tolist())
+    new = [p for p in _pending if p[0] not in known]
+    _build(
+        list(_codes) + [p[0] for p in new],
+        list(_names) + [p[1] for p in new],
+        np.vstack([_latlon, np.array([(p[2], p[3]) for p in new]).reshape(-1, 2)])
+    )
+
+
+def nearest_airports(lats, lons, k: int = 5, radius_nm: float | None = None) -> list:
+    """
+    For each position (lats[i], lons[i]) return the up-to-k nearest airports
+    (optionally within radius_nm), closest first:
+      [[{"icao", "name", "lat", "lon", "distanceNm"}, ...], ...]
+    Vectorized over all positions, so e.g. every VATSIM pilot can be looked up at once.
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    points = _to_xyz(lats, lons)
+    upper = float(_nm_to_chord(radius_nm)) if radius_nm is not None else np.inf
+
+    with _index_lock:
+        if _dirty or time.monotonic() - _built_at > REBUILD_MAX_AGE_SECONDS:
+            _rebuild_from_db()
+        elif len(_pending) >= MAX_PENDING:
+            _merge_pending()
+        tree, codes, names, latlon = _tree, _codes, _names, _latlon
+        pending = list(_pending)
+
+    # Candidates from the tree: (n_points, k) chord distances + indices
+    if tree is not None:
+        kk = min(k, len(codes))
+        dist, idx = tree.query(points, k=kk, distance_upper_bound=upper)
+        dist = np.asarray(dist).reshape(len(points), kk)
+        idx = np.asarray(idx).reshape(len(points), kk)
+    else:
+        dist = np.empty((len(points), 0))
+        idx = np.empty((len(points), 0), dtype=int)
+
+    # Candidates from pending inserts, brute-force (there are only a few)
+    if pending:
+        p_latlon = np.array([(p[2], p[3]) for p in pending], dtype=float)
+        p_dist = np.linalg.norm(points[:, None, :] - _to_xyz(p_latlon[:, 0], p_latlon[:, 1])[None, :, :], axis=2)
+        known = set(codes.tolist())
+    else:
+        p_dist = np.empty((len(points), 0))
+        known = set()
+
+    results = []
+    for row in range(len(points)):
+        candidates = []
+        for d, i in zip(dist[row], idx[row]):
+            if np.isfinite(d):
+                candidates.append((d, codes[i], names[i], latlon[i][0], latlon[i][1]))
+        for j, p in enumerate(pending):
+            d = p_dist[row, j]
+            if d <= upper and p[0] not in known:
+                candidates.append((d, p[0], p[1], p[2], p[3]))
+        candidates.sort(key=lambda c: c[0])
+
+        results.append([
+            {
+                "icao": c[1],
+                "name": c[2],
+                "lat": float(c[3]),
+                "lon": float(c[4]),
+                "distanceNm": round(float(_chord_to_nm(c[0])), 1)
+            }
+            for c in candidates[:k]
+        ])
+    return results
+
+
+def invalidate():
+    """
+    Force a full rebuild from the table on the next query.
+    """
+    global _dirty
+    with _index_lock:
+        _dirty = True
+
+
+def _session_info(target):
+    session = object_session(target)
+    return session.info if session is not None else None
+
+
+@event.listens_for(Airport, "after_insert")
+def _on_airport_insert(mapper, connection, target):
+    if target.latitude is None or target.longitude is None:
+        return
+    info = _session_info(target)
+    if info is not None:
+        info.setdefault(_INFO_INSERTS, []).append(
+            (target.icao, target.name, float(target.latitude), float(target.longitude))
+        )
+
+
+@event.listens_for(Airport, "after_update")
+@event.listens_for(Airport, "after_delete")
+def _on_airport_change(mapper, connection, target):
+    info = _session_info(target)
+    if info is not None:
+        info[_INFO_DIRTY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    inserts = session.info.pop(_INFO_INSERTS, None)
+    if session.info.pop(_INFO_DIRTY, False):
+        invalidate()
+    elif inserts:
+        with _index_lock:
+            if not _dirty:
+                _pending.extend(inserts)
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop(_INFO_INSERTS, None)
+    session.info.pop(_INFO_DIRTY, None)
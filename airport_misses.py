@@ -0,0 +1,134 @@
+"""
+airport_misses.py
+
+Negative cache for station codes CheckWX doesn't know, so a bogus code in a
+VATSIM flight plan costs one CheckWX call per AIRPORT_MISS_TTL_SECONDS
+instead of one per poll.
+
+Two layers:
+  1) is_valid_icao(): a syntactic pre-filter. Anything that can't be an ICAO
+     location indicator (or is a flight-plan placeholder like ZZZZ) is never
+     sent to CheckWX at all.
+  2) The `airport_miss` table (models/airport_miss.py), shared by all workers,
+     with a small in-memory front so repeat lookups don't hit the DB either.
+
+Only definitive answers are recorded ("CheckWX answered, and had no such
+station"); timeouts, 5xx and an open circuit are not.
+"""
+
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import db
+from models.airport_miss import AirportMiss
+
+AIRPORT_MISS_TTL_SECONDS = int(os.getenv("AIRPORT_MISS_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# How long a DB-confirmed miss is trusted from memory before asking the DB again
+MEMORY_TTL_SECONDS = 600
+
+# One letter (the ICAO region) followed by three letters/digits
+ICAO_PATTERN = re.compile(r"^[A-Z][A-Z0-9]{3}$")
+# Flight-plan placeholders: "ZZZZ" = no ICAO indicator, "AFIL" = filed in the air
+PLACEHOLDER_CODES = {"ZZZZ", "AFIL"}
+
+_memory = {}  # ICAO -> time.time() the entry expires
+_memory_lock = threading.Lock()
+
+# Session.info key for misses that only go into _memory once the session commits
+_INFO_MISSES = "airport_misses_recorded"
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, matching the DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def is_valid_icao(code: str) -> bool:
+    """
+    Could `code` (already stripped/uppercased) be a real ICAO location indicator?
+    """
+    return bool(ICAO_PATTERN.match(code)) and code not in PLACEHOLDER_CODES
+
+
+def known_misses(icaos) -> set:
+    """
+    Return the subset of `icaos` with an unexpired negative-cache entry
+    (memory first, then one `IN (...)` query for the rest).
+    """
+    now = time.time()
+    found = set()
+    unknown = []
+    with _memory_lock:
+        for icao in icaos:
+            expires = _memory.get(icao)
+            if expires is not None and expires > now:
+                found.add(icao)
+            else:
+                _memory.pop(icao, None)
+                unknown.append(icao)
+    if not unknown:
+        return found
+
+    rows = (
+        AirportMiss.query
+        .with_entities(AirportMiss.icao)
+        .filter(AirportMiss.icao.in_(unknown), AirportMiss.expires_at > _utcnow())
+        .all()
+    )
+    with _memory_lock:
+        for (icao,) in rows:
+            _memory[icao] = now + MEMORY_TTL_SECONDS
+            found.add(icao)
+    return found
+
+
+def is_known_miss(icao: str) -> bool:
+    return icao in known_misses([icao])
+
+
+def record_miss(icao: str):
+    """
+    Remember that CheckWX has no data for `icao`. Adds/refreshes the row in the
+    current session; the caller commits (under the same advisory lock it used
+    for the lookup). The in-memory entry follows once that commit succeeds.
+    """
+    now = _utcnow()
+    db.session.merge(AirportMiss(
+        icao=icao,
+        checked_at=now,
+        expires_at=now + timedelta(seconds=AIRPORT_MISS_TTL_SECONDS)
+    ))
+    db.session.info.setdefault(_INFO_MISSES, set()).add(icao)
+    print(f"[airport_misses] {icao}: no station data, cached for {AIRPORT_MISS_TTL_SECONDS}s")
+
+
+def forget(icao: str):
+    """
+    Drop the negative entry for `icao` (e.g. the airport was added by hand).
+    Deletes in the current session; the caller commits.
+    """
+    with _memory_lock:
+        _memory.pop(icao, None)
+    AirportMiss.query.filter_by(icao=icao).delete()
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    misses = session.info.pop(_INFO_MISSES, None)
+    if misses:
+        expires = time.time() + min(MEMORY_TTL_SECONDS, AIRPORT_MISS_TTL_SECONDS)
+        with _memory_lock:
+            for icao in misses:
+                _memory[icao] = expires
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop(_INFO_MISSES, None)
@@ -0,0 +1,246 @@
+"""
+airport_snapshot.py
+
+Compact binary snapshot of the airport file cache (airport_cache.py), so a
+worker doesn't have to json.load() every station record at startup just to
+answer lat/lon lookups.
+
+One file, data/airportDb.snap:
+
+  b"APSNAP01" | uint64 header length | JSON header (HEADER_BYTES)
+  records   numpy structured array, sorted by ICAO:
+            (icao, lat, lon, elevation_ft, offset, length)
+  blob      the full CheckWX record of each station as compact JSON,
+            at blob[offset:offset + length]
+
+The file is mmap'ed read-only, so workers share the same pages through the
+OS page cache and only touch what they read. Lookups are a binary search
+(np.searchsorted) over the ICAO column; lat/lon come straight from the
+records and a station's JSON is only decoded when someone asks for the
+whole record.
+
+AirportSnapshotJournal plugs this into json_journal.JsonJournal: changes
+still go to the append-only journal, and compaction writes a new .snap
+(copying untouched records' JSON bytes as-is) instead of a JSON file. The
+old airportDb.json is only read to build the first snapshot (or to rebuild
+an unreadable one); after that the .snap + journal are the only source of
+truth, so touching or checking out the JSON file can't undo anything.
+"""
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import numpy as np
+
+from json_journal import JsonJournal
+
+MAGIC = b"APSNAP01"
+# Fixed-size (space-padded) JSON header, keeps the records 8-byte aligned
+HEADER_BYTES = 4096
+
+
+def _station_fields(record: dict):
+    lat = (record.get("latitude") or {}).get("decimal")
+    lon = (record.get("longitude") or {}).get("decimal")
+    elev = (record.get("elevation") or {}).get("feet")
+    return (
+        float(lat) if lat is not None else np.nan,
+        float(lon) if lon is not None else np.nan,
+        float(elev) if elev is not None else np.nan
+    )
+
+
+def write_snapshot(path: Path, items):
+    """
+    Write a snapshot from (icao, lat, lon, elevation_ft, json_bytes) tuples,
+    atomically (temp file + os.replace).
+    """
+    items = sorted(items, key=lambda it: it[0])
+    width = max([len(it[0].encode()) for it in items] + [4])
+    dtype = np.dtype([
+        ("icao", f"S{width}"),
+        ("lat", "<f8"),
+        ("lon", "<f8"),
+        ("elevation_ft", "<f4"),
+        ("offset", "<i8"),
+        ("length", "<i4")
+    ])
+    records = np.zeros(len(items), dtype=dtype)
+    offset = 0
+    for i, (icao, lat, lon, elev, raw) in enumerate(items):
+        records[i] = (icao.encode(), lat, lon, elev, offset, len(raw))
+        offset += len(raw)
+
+    records_offset = len(MAGIC) + 8 + HEADER_BYTES
+    header = {
+        "count": len(items),
+        "dtype": dtype.descr,
+        "records_offset": records_offset,
+        "blob_offset": records_offset + records.nbytes
+    }
+    header_bytes = json.dumps(header).encode().ljust(HEADER_BYTES)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(records.tobytes())
+        for it in items:
+            f.write(it[4])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class AirportSnapshot(MutableMapping):
+    """
+    Dict-like view ICAO -> CheckWX record over an mmap'ed snapshot, plus the
+    changes made since (overlay / deleted). Use coords() for lat/lon without
+    decoding the record.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self._records = None
+        self._codes = np.empty(0, dtype="S4")
+        self._blob = b""
+        self._overlay = {}
+        self._deleted = set()
+        if path is not None:
+            self._open(Path(path))
+
+    def _open(self, path: Path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an airport snapshot")
+        (header_len,) = struct.unpack_from("<Q", mm, len(MAGIC))
+        header = json.loads(bytes(mm[len(MAGIC) + 8:len(MAGIC) + 8 + header_len]))
+        dtype = np.dtype([tuple(field) for field in header["dtype"]])
+        self._records = np.frombuffer(mm, dtype=dtype, count=header["count"], offset=header["records_offset"])
+        self._codes = self._records["icao"]
+        self._blob = memoryview(mm)[header["blob_offset"]:]
+
+    def _base_index(self, key: str):
+        code = key.encode()
+        i = int(np.searchsorted(self._codes, code))
+        if i < len(self._codes) and self._codes[i] == code:
+            return i
+        return None
+
+    def _raw(self, i: int) -> bytes:
+        rec = self._records[i]
+        return bytes(self._blob[int(rec["offset"]):int(rec["offset"]) + int(rec["length"])])
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        i = self._base_index(key)
+        if i is None:
+            raise KeyError(key)
+        return json.loads(self._raw(i))
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return True
+        return key not in self._deleted and self._base_index(key) is not None
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._overlay.pop(key, None)
+        if self._base_index(key) is not None:
+            self._deleted.add(key)
+
+    def __iter__(self):
+        yield from self._overlay
+        for code in self._codes:
+            key = code.decode()
+            if key not in self._overlay and key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        base = len(self._codes) - len(self._deleted)
+        return base + sum(1 for key in self._overlay if self._base_index(key) is None)
+
+    def coords(self, key: str):
+        """
+        (lat, lon) for `key`, or None if unknown / no position. No JSON decoding for snapshot records.
+        """
+        if key in self._overlay:
+            lat, lon, _ = _station_fields(self._overlay[key])
+        elif key in self._deleted:
+            return None
+        else:
+            i = self._base_index(key)
+            if i is None:
+                return None
+            lat, lon = float(self._records[i]["lat"]), float(self._records[i]["lon"])
+        if np.isnan(lat) or np.isnan(lon):
+            return None
+        return lat, lon
+
+    def snapshot_items(self):
+        """
+        (icao, lat, lon, elevation_ft, json_bytes) for every station, for
+        write_snapshot(). Untouched snapshot records are copied without decoding.
+        """
+        for key, value in self._overlay.items():
+            yield (key, *_station_fields(value), json.dumps(value, separators=(",", ":")).encode())
+        for i, code in enumerate(self._codes):
+            key = code.decode()
+            if key in self._overlay or key in self._deleted:
+                continue
+            rec = self._records[i]
+            yield key, float(rec["lat"]), float(rec["lon"]), float(rec["elevation_ft"]), self._raw(i)
+
+
+class AirportSnapshotJournal(JsonJournal):
+    """
+    JsonJournal whose snapshot is a binary .snap file (see module docstring).
+    `json_path` is the legacy airportDb.json; the journal keeps living next to it.
+    """
+
+    def __init__(self, json_path: Path, snapshot_path: Path, name: str):
+        super().__init__(json_path, name)
+        self.snapshot_path = Path(snapshot_path)
+
+    def _read_snapshot(self, rebuild: bool = True):
+        snap, legacy = self.snapshot_path, self.path
+        if snap.exists():
+            try:
+                return AirportSnapshot(snap)
+            except (OSError, ValueError) as e:
+                print(f"[{self.name}] Error reading {snap.name}, rebuilding it from {legacy.name}: {e}")
+
+        if not legacy.exists():
+            return AirportSnapshot()
+        if not rebuild:
+            view = AirportSnapshot()
+            view._overlay = super()._read_snapshot()
+            return view
+
+        # First run (or the snapshot is unreadable): convert the JSON file once.
+        # load() replays the journal on top, as with any snapshot.
+        data = super()._read_snapshot()
+        write_snapshot(snap, (
+            (key, *_station_fields(value), json.dumps(value, separators=(",", ":")).encode())
+            for key, value in data.items()
+        ))
+        print(f"[{self.name}] Built {snap.name} from {legacy.name} ({len(data)} stations).")
+        return AirportSnapshot(snap)
+
+    def _write_snapshot(self, snapshot):
+        write_snapshot(self.snapshot_path, snapshot.snapshot_items())
@@ -10,8 +10,8 @@ This file:
 """
 
 import os
-import json
-from datetime import datetime, timedelta, date
+import math
+from datetime import datetime, timedelta, date, timezone
 import requests
 
 from flask import Flask, send_from_directory, request, jsonify
@@ -20,20 +20,38 @@ from flask_migrate import Migrate
 from influxdb_client import InfluxDBClient
 from dotenv import load_dotenv
 from db import db, init_db_uri
+from http_cache import init_http_cache
+import coord_cache
 
 from models.airport import Airport
 from models.aircraft_type import AircraftType
 from models.airline import Airline
 from models.airline_hub import AirlineHub
 from models.aircraft import Aircraft
+from models.airport_miss import AirportMiss
+from models.api_quota import ApiQuota
 
 from routes.aircraft_routes import aircraft_bp
 from routes.airport_routes import airport_bp
 
 from routes.aircraft_type_routes import aircraft_type_bp
 from routes.airline_routes import airline_bp
+from routes.vatsim_routes import vatsim_bp
 
-from routes.airport_routes import fetch_or_get_airport_coords
+from routes.airport_routes import fetch_or_get_airport_coords, fetch_or_get_airport_coords_batch
+from routes.airport_routes import normalize_icao_list, MAX_BATCH_ICAOS, get_or_create_airport
+from routes.airport_routes import unavailable_response
+
+from weather_cache import get_forecast, snap_coord, project_forecast, compact_forecast
+from price_store import get_many_day_prices, PRICE_REGIONS
+from metar_poller import start_metar_poller, get_latest_metars, refresh_metars
+from metar_poller import STALE_AFTER_SECONDS as METAR_STALE_AFTER_SECONDS
+import upstream
+from geo import distance_nm, distance_matrix_nm
+import sun_table
+import solar
+import metar_history
+import airport_misses
 
 
 
@@ -46,11 +64,18 @@ app = Flask(__name__, static_folder='public', static_url_path='')
 app = init_db_uri(app)  # Initialize the SQLite database
 
 db.init_app(app)  # Bind the SQLAlchemy db to the Flask app
+app = init_http_cache(app)  # ETag/304 + gzip/brotli for all JSON responses
 with app.app_context():
     migrate = Migrate(app, db)
 
     # db.create_all()  # Create the tables if they don't exist
 
+    # Airport coordinates for /api/distance, so steady-state calls never hit the DB
+    try:
+        coord_cache.warm()
+    except Exception as e:
+        print(f"[coord_cache] Warm-up skipped: {e}")
+
 
 ###############################
 # 2) Register the blueprints
@@ -60,11 +85,7 @@ app.register_blueprint(aircraft_bp, url_prefix="/api/aircraft")
 app.register_blueprint(airport_bp, url_prefix="/api/airport")
 app.register_blueprint(aircraft_type_bp, url_prefix="/api/aircraft_types")
 app.register_blueprint(airline_bp, url_prefix="/api/airlines")
-
-# Load your pre-fetched sunrise/sunset data from local JSON
-# Example structure: [{ "date": "2025-01-01", "sunrise": "08:47", "sunset": "16:11" }, ...]
-with open('sun_data.json', 'r', encoding='utf-8') as f:
-    SUN_DATA = json.load(f)
+app.register_blueprint(vatsim_bp, url_prefix="/api/vatsim")
 
 # APP SETUP
 APP_NAME = os.getenv("APP_NAME")
@@ -89,6 +110,10 @@ influx_client = InfluxDBClient(
     org=INFLUX_ORG
 )
 query_api = influx_client.query_api()
+metar_history.configure(query_api, INFLUX_BUCKET)
+
+# Keep the METAR board fresh in the background (served from memory by /api/metars)
+start_metar_poller()
 
 
 # ------------------------------------------------------
@@ -107,20 +132,36 @@ def index():
 # ------------------------------------------------------
 # 2. /api/weather
 #    Now extracts symbol_code for next_1, next_6, next_12
+#    Forecasts are cached per snapped lat/lon (weather_cache.py)
 # ------------------------------------------------------
 @app.route('/api/weather')
 def api_weather():
+    """
+    Optional projection (computed from the cached MET document):
+      ?fields=air_temperature,wind_speed  only these variables ("symbol_code" keeps the summaries)
+      ?hours=12                           only the next 12 hours of timesteps
+      ?compact=1                          flat rows instead of MET's nested structure
+    """
     lat = request.args.get('lat', '58.970052')
     lon = request.args.get('lon', '5.733395')
-    url = f"https://api.met.no/weatherapi/locationforecast/2.0/complete?lat={lat}&lon={lon}"
+    try:
+        lat, lon = snap_coord(lat), snap_coord(lon)
+    except ValueError:
+        return jsonify({"error": "lat/lon must be numbers"}), 400
+
+    fields_arg = request.args.get('fields')
+    fields = {f.strip() for f in fields_arg.split(',') if f.strip()} if fields_arg else None
+    hours = request.args.get('hours', None, int)
+    if hours is not None and hours <= 0:
+        return jsonify({"error": "hours must be a positive integer"}), 400
+    compact = request.args.get('compact', '').lower() in ("1", "true", "yes")
 
     headers = {
         'User-Agent': f'{APP_NAME}/{APP_VERSION} ({CONTACT_EMAIL})',
     }
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        # Served from memory until MET's Expires, then revalidated (see weather_cache.py)
+        data, stale = get_forecast(lat, lon, headers)
 
         # Extract symbol codes from first timeseries
         timeseries = data.get("properties", {}).get("timeseries", [])
@@ -144,13 +185,21 @@ def api_weather():
         if next12 and "summary" in next12:
             symbol_12h = next12["summary"].get("symbol_code")
 
-        # Add them to the JSON
-        out = data
+        # Add them to the JSON (copy, the cached document is shared)
+        if compact:
+            out = compact_forecast(data, fields, hours)
+        elif fields is not None or hours is not None:
+            out = project_forecast(data, fields, hours)
+        else:
+            out = dict(data)
         out["symbol_1h"] = symbol_1h
         out["symbol_6h"] = symbol_6h
         out["symbol_12h"] = symbol_12h
 
-        return jsonify(out)
+        resp = jsonify(out)
+        if stale:
+            resp.headers["Warning"] = upstream.STALE_WARNING
+        return resp
 
     except requests.RequestException as e:
         return jsonify({"error": str(e)}), 500
@@ -160,73 +209,80 @@ def api_weather():
 # 3. /api/prices -> hvakosterstrommen.no
 #    e.g. GET /api/prices?region=NO2
 # ------------------------------------------------------
+# Shared deadline for all upstream price fetches of one request
+PRICES_DEADLINE_SECONDS = 10
+
+
 @app.route('/api/prices')
 def api_prices():
-    region = request.args.get('region', 'NO2')
+    """
+    GET /api/prices?region=NO2
+      => {"today": {...}, "tomorrow": {...} | null}
 
-    now = datetime.now()
-    year = now.year
-    month = f"{now.month:02d}"
-    day = f"{now.day:02d}"
+    GET /api/prices?region=NO1,NO2
+      => {"regions": {"NO1": {"today": ..., "tomorrow": ...}, "NO2": {...}}}
 
-    # Build today's URL
-    url_today = f"https://www.hvakosterstrommen.no/api/v1/prices/{year}/{month}-{day}_{region}.json"
+    Today's (and after 13:15, tomorrow's) files for all requested regions are
+    fetched concurrently, against one shared deadline.
+    """
+    regions = [r.strip().upper() for r in request.args.get('region', 'NO2').split(',') if r.strip()]
+    if not regions:
+        return jsonify({"error": "Missing region"}), 400
+    for region in regions:
+        if region not in PRICE_REGIONS:
+            return jsonify({"error": f"Unknown region {region}"}), 400
+
+    today = date.today()
+    days = [today]
+
+    # After 13:15 local time, also attempt tomorrow
+    # E.g. if now=2025-01-24, tomorrow=2025-01-25
+    local_now = datetime.now()
+    cutoff_time = local_now.replace(hour=13, minute=15, second=0, microsecond=0)
+    if local_now >= cutoff_time:
+        days.append(today + timedelta(days=1))
+
+    # Memory/disk first, upstream only once per day (see price_store.py)
+    fetched = get_many_day_prices(
+        [(day, region) for region in regions for day in days],
+        PRICES_DEADLINE_SECONDS
+    )
+
+    by_region = {}
+    for region in regions:
+        # We'll store results in a dict to return
+        result = {
+            "today": None,
+            "tomorrow": None
+        }
 
-    # We'll store results in a dict to return
-    result = {
-        "today": None,
-        "tomorrow": None
-    }
+        data_today = fetched[(today, region)]
+        if isinstance(data_today, Exception) or data_today is None:
+            reason = data_today if data_today is not None else "not published"
+            return jsonify({"error": f"Failed to fetch today's prices for {region}: {reason}"}), 500
 
-    try:
-        # 1) Fetch today's data
-        resp_today = requests.get(url_today, timeout=10)
-        resp_today.raise_for_status()
-        data_today = resp_today.json()
-
-        # Compute average
-        avg_today = compute_average_price(data_today)
-        # We'll store today's data
         result["today"] = {
-            "date": f"{year}-{month}-{day}",
-            "average": avg_today,
+            "date": today.isoformat(),
+            "average": compute_average_price(data_today),
             "prices": data_today
         }
-    except requests.RequestException as e:
-        return jsonify({"error": f"Failed to fetch today's prices: {e}"}), 500
 
-    # 2) After 13:15 local time, attempt tomorrow
-    #    We also build the next day's URL
-    #    E.g. if now=2025-01-24, tomorrow=2025-01-25
-    #    If the request fails or not found, we skip it
-    local_now = datetime.now()
-    # Check if local time >= 13:15
-    cutoff_time = local_now.replace(hour=13, minute=15, second=0, microsecond=0)
-    if local_now >= cutoff_time:
-        # Build tomorrow's date
-        tomorrow = local_now + timedelta(days=1)
-        year_tom = tomorrow.year
-        month_tom = f"{tomorrow.month:02d}"
-        day_tom = f"{tomorrow.day:02d}"
-        url_tomorrow = f"https://www.hvakosterstrommen.no/api/v1/prices/{year_tom}/{month_tom}-{day_tom}_{region}.json"
-
-        try:
-            resp_tom = requests.get(url_tomorrow, timeout=10)
-            if resp_tom.status_code == 200:
-                data_tom = resp_tom.json()
-                avg_tom = compute_average_price(data_tom)
+        # Tomorrow is optional: not published yet or failed => we skip it
+        if len(days) > 1:
+            tomorrow = days[1]
+            data_tom = fetched[(tomorrow, region)]
+            if data_tom is not None and not isinstance(data_tom, Exception):
                 result["tomorrow"] = {
-                    "date": f"{year_tom}-{month_tom}-{day_tom}",
-                    "average": avg_tom,
+                    "date": tomorrow.isoformat(),
+                    "average": compute_average_price(data_tom),
                     "prices": data_tom
                 }
-            else:
-                # Not available or 404 => just ignore
-                pass
-        except requests.RequestException:
-            pass
 
-    return jsonify(result)
+        by_region[region] = result
+
+    if len(regions) == 1:
+        return jsonify(by_region[regions[0]])
+    return jsonify({"regions": by_region})
 
 
 def compute_average_price(price_data):
@@ -260,36 +316,94 @@ def compute_average_price(price_data):
 
 
 # ------------------------------------------------------
-# 4. /api/sun -> local sunrise/sunset from sun_data.json
+# 4. /api/sun -> sunrise/sunset (+ twilight) for a date or date range
 #    e.g. GET /api/sun?date=2025-01-24
+#         GET /api/sun?from=2025-01-01&to=2025-01-31
+#         GET /api/sun?icao=ENGM&date=2025-06-21
+#         GET /api/sun?lat=60.19&lon=11.1&tz=Europe/Oslo
+#         GET /api/sun?location=tromso&from=2025-01-01&to=2025-12-31
+#    Computed locally (solar.py); for the named locations (default: Stavanger)
+#    the pre-fetched MET times (sun_table.py) win for the dates they cover.
 # ------------------------------------------------------
 @app.route('/api/sun')
 def api_sun():
-    # If date not provided, default to "today"
-    date_str = request.args.get('date')
-    if not date_str:
-        date_str = date.today().isoformat()  # "YYYY-MM-DD"
-
-    # Find matching entry in SUN_DATA
-    found = next((d for d in SUN_DATA if d['date'] == date_str), None)
-    if not found:
-        # If no match, return a placeholder or error
+    location, error = _sun_location()
+    if error:
+        return error
+
+    if request.args.get('from') or request.args.get('to'):
+        try:
+            start = date.fromisoformat(request.args.get('from') or request.args.get('to'))
+            end = date.fromisoformat(request.args.get('to') or request.args.get('from'))
+        except ValueError:
+            return jsonify({"error": "from/to must be YYYY-MM-DD dates"}), 400
+        if end < start:
+            return jsonify({"error": "'to' is before 'from'"}), 400
+        if (end - start).days + 1 > sun_table.MAX_RANGE_DAYS:
+            return jsonify({"error": f"At most {sun_table.MAX_RANGE_DAYS} days per request"}), 400
+
+        # { "type": "FeatureCollection", "features": [<one Feature per day>] }
         return jsonify({
-            "date": date_str,
-            "sunrise": None,
-            "sunset": None,
-            "note": "No local data stored for this date"
+            "type": "FeatureCollection",
+            "features": _sun_features(location, start, end)
         })
 
+    # If date not provided, default to "today"
+    try:
+        day = date.fromisoformat(request.args.get('date') or date.today().isoformat())
+    except ValueError:
+        return jsonify({"error": "date must be a YYYY-MM-DD date"}), 400
+
     # Return an object shaped similarly to Sunrise 3.0's "Feature"
-    return {
-        "type": "Feature",
-        "properties": {
-            "date": found["date"],
-            "sunrise": {"time": f"{found['date']}T{found['sunrise']}:00+01:00"},
-            "sunset": {"time": f"{found['date']}T{found['sunset']}:00+01:00"}
-        }
-    }
+    return _sun_features(location, day, day)[0]
+
+
+def _sun_location():
+    """
+    (lat, lon, tz, table_location) from ?icao=, ?lat=&lon=[&tz=] or
+    ?location=<sun_table.LOCATIONS name> (default: sun_table.DEFAULT_LOCATION),
+    as (location, None) or (None, error response).
+    """
+    icao = (request.args.get('icao') or '').strip().upper()
+    name = (request.args.get('location') or '').strip().lower()
+    lat = request.args.get('lat', None, float)
+    lon = request.args.get('lon', None, float)
+    tz = request.args.get('tz')
+
+    if icao:
+        try:
+            ap = get_or_create_airport(icao)
+        except upstream.UpstreamUnavailable as e:
+            return None, unavailable_response(e)
+        if not ap or ap.latitude is None or ap.longitude is None:
+            return None, (jsonify({"error": f"No coordinates for {icao}"}), 404)
+        lat, lon = ap.latitude, ap.longitude
+        # CheckWX station records carry the IANA zone, e.g. "Europe/Oslo"
+        tz = tz or ((ap.details or {}).get("timezone") or {}).get("tzid")
+    elif lat is None and lon is None:
+        name = name or sun_table.DEFAULT_LOCATION
+        if name not in sun_table.LOCATIONS:
+            return None, (jsonify({"error": f"Unknown location {name}"}), 404)
+        return (*sun_table.LOCATIONS[name], name), None
+    elif lat is None or lon is None or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        return None, (jsonify({"error": "Missing or invalid lat/lon"}), 400)
+
+    tz = tz or "UTC"
+    if not solar.is_valid_timezone(tz):
+        return None, (jsonify({"error": f"Unknown timezone {tz}"}), 400)
+    return (lat, lon, tz, None), None
+
+
+def _sun_features(location, start: date, end: date) -> list:
+    lat, lon, tz, table_location = location
+    features = []
+    for day in solar.get_days(lat, lon, tz, start, end):
+        feature = solar.sun_feature(day)
+        stored = sun_table.get_day(day["date"], table_location) if table_location else None
+        if stored:
+            feature["properties"].update(sun_table.sun_feature(stored)["properties"])
+        features.append(feature)
+    return features
 
 
 # ------------------------------------------------------
@@ -319,93 +433,69 @@ def api_enzv():
         },
         ...
       ],
-      "trend": "up" | "down" | "steady"
+      "trend": "up" | "down" | "steady",
+      "station": "ENZV", "range": "24h", "every": null
     }
+
+    Optional parameters:
+      station=ENGM       any ICAO code we record METARs for (default ENZV)
+      range=7d           how far back, in m/h/d (default 24h, at most 90d)
+      points=300         downsample to about this many rows, or
+      every=30m          one row per this interval (mean/last/min/max per field)
+    Up to 24h without points/every the raw rows are served from memory;
+    longer ranges are downsampled to metar_history.DEFAULT_POINTS by default.
+    "current" and "trend" always come from the latest raw rows.
     """
+    station = (request.args.get("station") or "ENZV").strip().upper()
+    if not airport_misses.is_valid_icao(station):
+        return jsonify({"error": "station must be an ICAO code"}), 400
+
+    range_str = request.args.get("range") or "24h"
+    range_seconds = metar_history.parse_duration(range_str)
+    if range_seconds is None or range_seconds > metar_history.MAX_RANGE_SECONDS:
+        return jsonify({"error": "range must be like 6h or 7d, at most 90d"}), 400
+
+    every = request.args.get("every")
+    points = request.args.get("points", None, int)
+    if every:
+        every_seconds = metar_history.parse_duration(every)
+        if every_seconds is None or range_seconds / every_seconds > metar_history.MAX_POINTS:
+            return jsonify({"error": f"every must be like 30m or 1h, at most {metar_history.MAX_POINTS} "
+                                     f"points per range"}), 400
+    elif points is not None:
+        if not (1 <= points <= metar_history.MAX_POINTS):
+            return jsonify({"error": f"points must be between 1 and {metar_history.MAX_POINTS}"}), 400
+    elif range_seconds > metar_history.WINDOW_SECONDS:
+        points = metar_history.DEFAULT_POINTS
+    if points is not None and not every:
+        every = f"{max(1, math.ceil(range_seconds / points / 60))}m"
 
     try:
-        # 1) Flux query for the last 6h, measurement=metar, station_id=ENZV
-        # We'll filter for each _field we want, then pivot so each row has all fields.
-        flux_query = f"""
-        from(bucket: "{INFLUX_BUCKET}")
-          |> range(start: -24h)
-          |> filter(fn: (r) => r["_measurement"] == "metar")
-          |> filter(fn: (r) => r["station_id"] == "ENZV")
-          |> filter(fn: (r) =>
-            r["_field"] == "altim_hpa" or
-            r["_field"] == "altim_in_hg" or
-            r["_field"] == "dewpoint_c" or
-            r["_field"] == "temp_c" or
-            r["_field"] == "visibility_statute_mi" or
-            r["_field"] == "wind_dir_deg" or
-            r["_field"] == "wind_speed_kt"
-          )
-          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
-          |> sort(columns: ["_time"], desc: false)
-        """
-
-        tables = query_api.query(flux_query)
-
-        # We'll collect all rows into `points`.
-        # Each row is a "record" with record.values dict including
-        # { ... altim_hpa, altim_in_hg, dewpoint_c, temp_c, visibility_statute_mi, wind_dir_deg, wind_speed_kt, ... }
-        points = []
-        for table in tables:
-            for record in table.records:
-                # record.get_time() => datetime object
-                # We'll store "time" as ISO string
-                dt_iso = record.get_time().isoformat()
-                row = {
-                    "time": dt_iso,
-                    "altim_hpa": record.values.get("altim_hpa"),
-                    "altim_in_hg": record.values.get("altim_in_hg"),
-                    "dewpoint_c": record.values.get("dewpoint_c"),
-                    "temp_c": record.values.get("temp_c"),
-                    "visibility_statute_mi": record.values.get("visibility_statute_mi"),
-                    "wind_dir_deg": record.values.get("wind_dir_deg"),
-                    "wind_speed_kt": record.values.get("wind_speed_kt")
-                }
-                points.append(row)
-
-        if not points:
-            return jsonify({"error": "No ENZV data in last 6h"}), 404
-
-        # 2) The "current" data is the last row (since sort desc:false)
-        current = points[-1]
-
-        current_data = {
-            "time": current["time"],
-            "altim_hpa": current["altim_hpa"],
-            "altim_in_hg": current["altim_in_hg"],
-            "dewpoint_c": current["dewpoint_c"],
-            "temp_c": current["temp_c"],
-            "visibility_statute_mi": current["visibility_statute_mi"],
-            "wind_dir_deg": current["wind_dir_deg"],
-            "wind_speed_kt": current["wind_speed_kt"]
-        }
-
-        # 3) We'll build a "history" array for the chart. We can keep all fields,
-        # or just a subset. Let's keep them all, or at least altim_hpa & temp_c, etc.
-        history = []
-        for p in points:
-            history.append({
-                "time": p["time"],
-                "altim_hpa": p["altim_hpa"],
-                "altim_in_hg": p["altim_in_hg"],
-                "dewpoint_c": p["dewpoint_c"],
-                "temp_c": p["temp_c"],
-                "visibility_statute_mi": p["visibility_statute_mi"],
-                "wind_dir_deg": p["wind_dir_deg"],
-                "wind_speed_kt": p["wind_speed_kt"]
-            })
-
-        # 4) Trend based on altim_hpa changes over last hour
-        trend = compute_altim_trend(points)
-
+        # 1) Last 24h of rows from the in-memory window (metar_history.py),
+        #    which only asks Influx for the rows it doesn't have yet
+        latest = metar_history.get_rows(station)
+
+        # 2) The chart: the window itself, or Influx-side aggregates for longer/downsampled views
+        if every:
+            history = metar_history.get_downsampled(station, range_str, every)
+        elif range_seconds < metar_history.WINDOW_SECONDS:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=range_seconds)
+            history = [p for p in latest if datetime.fromisoformat(p["time"]) >= cutoff]
+        else:
+            history = latest
+
+        if not latest and not history:
+            return jsonify({"error": f"No {station} data in last {range_str}"}), 404
+
+        # 3) The "current" data is the last raw row,
+        # 4) trend based on altim_hpa changes over last hour
         return jsonify({
-            "current": current_data,
+            "current": latest[-1] if latest else history[-1],
             "history": history,
-            "trend": trend
+            "trend": compute_altim_trend(latest),
+            "station": station,
+            "range": range_str,
+            "every": every
         })
 
     except Exception as e:
@@ -449,8 +539,10 @@ def compute_altim_trend(points):
 @app.route("/api/metars")
 def api_metars():
     """
-    Fetch raw METAR data for KJFK, KLAX, ENZV, ENGM from FAA:
-      https://aviationweather.gov/api/data/metar?ids=kjfk,klax,enzv,engm&format=json
+    Latest METARs for the board stations (see metar_poller.METAR_STATIONS),
+    served from memory. The payload is refreshed in the background, the
+    standard `Age` header says how old it is (in seconds). If the poller
+    keeps failing, the last good payload is still served, with a `Warning`.
 
     Returns JSON array, e.g.
     [
@@ -464,81 +556,142 @@ def api_metars():
       { ... ENGM ... }
     ]
     """
+    data, age = get_latest_metars()
+    if data is None:
+        # Poller hasn't succeeded yet (cold start) => fetch once synchronously
+        try:
+            data, age = refresh_metars(), 0
+        except requests.RequestException as e:
+            return jsonify({"error": str(e)}), 500
 
-    url = ("https://aviationweather.gov/api/data/metar?ids=kjfk,klax,enzv,engm,kord,egll,rjaa,ekch,kmia,"
-           "tncm&format=json")
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()  # raise exception if not 2xx
-        data = resp.json()  # parse JSON array
-        # data is a list of dictionaries, one per station
-
-        # Optionally, you can transform or filter out fields you don’t need.
-        # For example, if you only want the rawOb and icaoId, do:
-        #
-        #   trimmed = []
-        #   for item in data:
-        #       trimmed.append({
-        #           "icaoId": item["icaoId"],
-        #           "rawOb": item["rawOb"]
-        #       })
-        #   return jsonify(trimmed)
-        #
-        # Otherwise, just return the entire array:
-
-        return jsonify(data)
+    resp = jsonify(data)
+    resp.headers["Age"] = str(int(age))
+    if age > METAR_STALE_AFTER_SECONDS:
+        resp.headers["Warning"] = upstream.STALE_WARNING
+    return resp
 
-    except requests.RequestException as e:
-        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/upstream/stats")
+def api_upstream_stats():
+    """
+    Per-upstream request/error counters and latency from the shared client (upstream.py).
+    """
+    return jsonify(upstream.get_stats())
+
+
+# Upper bound on positions x airports per batch distance request
+MAX_DISTANCE_PAIRS = 100_000
 
 
 @app.route("/api/distance")
 def api_distance():
-    icao = request.args.get("icao", "ENGM")
+    """
+    GET /api/distance?icao=ENGM&lat=..&lon=..
+      => {"icao", "yourPos", "airportPos", "distanceNm"}
+
+    GET /api/distance?icao=ENGM,ENZV,EGLL&lat=..&lon=..
+      => {"yourPos": [..], "distances": {"ENGM": {"airportPos": [..], "distanceNm": 123.4}, ...},
+          "missing": [...]}
+    """
+    icao_arg = request.args.get("icao", "ENGM")
     lat = request.args.get("lat", None, float)
     lon = request.args.get("lon", None, float)
 
-    print(f"[/api/distance] Received request: icao={icao}, lat={lat}, lon={lon}")
-
     if lat is None or lon is None:
-        err_msg = "[/api/distance] Missing lat/lon in query params"
-        print(err_msg)
-        return jsonify({"error": err_msg}), 400
+        return jsonify({"error": "[/api/distance] Missing lat/lon in query params"}), 400
+
+    icaos = normalize_icao_list(icao_arg.split(","))
+    if not icaos:
+        return jsonify({"error": "[/api/distance] Missing icao"}), 400
+
+    if "," not in icao_arg:
+        icao = icaos[0]
+        # Attempt to get or fetch coordinates from the DB
+        try:
+            coords = fetch_or_get_airport_coords(icao)
+        except upstream.UpstreamUnavailable as e:
+            # CheckWX is down / out of quota: that's not "airport not found"
+            return unavailable_response(e)
+        if not coords:
+            err_msg = f"[/api/distance] Could not retrieve coords for {icao}"
+            print(err_msg)
+            return jsonify({"error": err_msg}), 404
+
+        dist_nm = distance_nm(lat, lon, coords["lat"], coords["lon"])
+        return jsonify({
+            "icao": icao,
+            "yourPos": [lat, lon],
+            "airportPos": [coords["lat"], coords["lon"]],
+            "distanceNm": round(dist_nm, 1)
+        })
 
-    # Attempt to get or fetch coordinates from the DB
-    coords = fetch_or_get_airport_coords(icao)
-    if not coords:
-        err_msg = f"[/api/distance] Could not retrieve coords for {icao}"
-        print(err_msg)
-        return jsonify({"error": err_msg}), 404
+    if len(icaos) > MAX_BATCH_ICAOS:
+        return jsonify({"error": f"[/api/distance] At most {MAX_BATCH_ICAOS} airports per request"}), 400
 
-    dist_nm = distance_nm(lat, lon, coords["lat"], coords["lon"])
-    print(f"[/api/distance] Computed distance {dist_nm:.1f} nm from ({lat},{lon}) to {coords}")
+    coords = fetch_or_get_airport_coords_batch(icaos)
+    found = [icao for icao in icaos if icao in coords]
+    dists = distance_matrix_nm(
+        [lat], [lon],
+        [coords[i]["lat"] for i in found], [coords[i]["lon"] for i in found]
+    )[0] if found else []
 
     return jsonify({
-        "icao": icao,
         "yourPos": [lat, lon],
-        "airportPos": [coords["lat"], coords["lon"]],
-        "distanceNm": round(dist_nm, 1)
+        "distances": {
+            icao: {
+                "airportPos": [coords[icao]["lat"], coords[icao]["lon"]],
+                "distanceNm": round(float(d), 1)
+            }
+            for icao, d in zip(found, dists)
+        },
+        "missing": [icao for icao in icaos if icao not in coords]
     })
 
 
-def distance_nm(lat1, lon1, lat2, lon2):
-    # same formula as your code
-    import math
-    R = 6371.0  # Earth radius in km
-    toRad = math.pi / 180.0
-    dLat = (lat2 - lat1) * toRad
-    dLon = (lon2 - lon1) * toRad
-    a = (math.sin(dLat / 2) ** 2
-         + math.cos(lat1 * toRad) * math.cos(lat2 * toRad)
-         * math.sin(dLon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    dist_km = R * c
-    dist_nm = dist_km / 1.852
-    return dist_nm
-
+@app.route("/api/distance", methods=["POST"])
+def api_distance_batch():
+    """
+    POST /api/distance
+    Many positions against many airports in one vectorized pass:
+    {
+      "positions": [[58.9, 5.6], [60.1, 11.0], ...],
+      "icao": ["ENGM", "ENZV", ...]
+    }
+    => {"icao": [found codes], "distancesNm": [[row per position, one value per airport]],
+        "missing": [...]}
+    """
+    data = request.json or {}
+    positions = data.get("positions")
+    codes = data.get("icao")
+    if not isinstance(positions, list) or not isinstance(codes, list):
+        return jsonify({"error": "Expected {\"positions\": [[lat, lon], ...], \"icao\": [...]}"}), 400
+    try:
+        lats = [float(p[0]) for p in positions]
+        lons = [float(p[1]) for p in positions]
+    except (TypeError, ValueError, IndexError):
+        return jsonify({"error": "positions must be [lat, lon] pairs"}), 400
+
+    icaos = normalize_icao_list(codes)
+    if not positions or not icaos:
+        return jsonify({"error": "Need at least one position and one ICAO"}), 400
+    if len(icaos) > MAX_BATCH_ICAOS:
+        return jsonify({"error": f"At most {MAX_BATCH_ICAOS} airports per request"}), 400
+    if len(positions) * len(icaos) > MAX_DISTANCE_PAIRS:
+        return jsonify({"error": f"At most {MAX_DISTANCE_PAIRS} position/airport pairs per request"}), 400
+
+    coords = fetch_or_get_airport_coords_batch(icaos)
+    found = [icao for icao in icaos if icao in coords]
+    matrix = distance_matrix_nm(
+        lats, lons,
+        [coords[i]["lat"] for i in found], [coords[i]["lon"] for i in found]
+    ) if found else None
 
+    return jsonify({
+        "icao": found,
+        "airportPos": [[coords[i]["lat"], coords[i]["lon"]] for i in found],
+        "distancesNm": matrix.round(1).tolist() if matrix is not None else [[] for _ in positions],
+        "missing": [icao for icao in icaos if icao not in coords]
+    })
 
 
 # ------------------------------------------------------
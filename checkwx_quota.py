@@ -0,0 +1,171 @@
+"""
+checkwx_quota.py
+
+Daily request budget for CheckWX (CHECKWX_DAILY_QUOTA, 3000/day on our plan).
+
+The budget is a token bucket stored in the `api_quota` table, so it is
+shared by every worker (row lock via SELECT ... FOR UPDATE) and survives
+restarts. One token = one HTTP request, however many stations it asks for.
+
+The bucket holds at most CHECKWX_BURST tokens and refills continuously at
+(CHECKWX_DAILY_QUOTA - CHECKWX_BURST) per day, so no rolling 24 h window can
+ever exceed the daily quota.
+
+Callers say who they are:
+  - INTERACTIVE (someone is waiting on the answer) may drain the bucket,
+  - BACKGROUND (preloads, summaries) must leave CHECKWX_BACKGROUND_RESERVE
+    tokens for interactive lookups.
+
+acquire() raises QuotaExhausted (an upstream.UpstreamUnavailable) when the
+caller can't have a token, so existing "CheckWX is down" handling applies.
+Without an app context (scripts, airport_cache.py) a process-local bucket
+is used instead.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+import upstream
+from db import db
+from models.api_quota import ApiQuota
+
+CHECKWX_DAILY_QUOTA = int(os.getenv("CHECKWX_DAILY_QUOTA", "3000"))
+CHECKWX_BURST = int(os.getenv("CHECKWX_BURST", "300"))
+CHECKWX_BACKGROUND_RESERVE = int(os.getenv("CHECKWX_BACKGROUND_RESERVE", "100"))
+
+QUOTA_NAME = "checkwx"
+REFILL_PER_SECOND = max(CHECKWX_DAILY_QUOTA - CHECKWX_BURST, 1) / 86400
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Fallback bucket when there's no app context / DB
+_local = None
+_local_lock = threading.Lock()
+
+
+class QuotaExhausted(upstream.UpstreamUnavailable):
+    """
+    Raised by acquire() when the caller's share of the CheckWX budget is used up.
+    `retry_after` is the number of seconds until a token is available to it.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, matching the DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _refill(state: dict, now: datetime) -> dict:
+    """
+    Bring a bucket state {"tokens", "updated_at", "day", "used"} up to `now`.
+    """
+    elapsed = max((now - state["updated_at"]).total_seconds(), 0)
+    tokens = min(CHECKWX_BURST, state["tokens"] + elapsed * REFILL_PER_SECOND)
+    used = state["used"] if state["day"] == now.date() else 0
+    return {"tokens": tokens, "updated_at": now, "day": now.date(), "used": used}
+
+
+def _new_state(now: datetime) -> dict:
+    return {"tokens": float(CHECKWX_BURST), "updated_at": now, "day": now.date(), "used": 0}
+
+
+def _take(state: dict, priority: str, cost: int) -> dict:
+    """
+    Take `cost` tokens from an up-to-date state, or raise QuotaExhausted.
+    """
+    floor = 0 if priority == INTERACTIVE else CHECKWX_BACKGROUND_RESERVE
+    if state["tokens"] - cost < floor:
+        retry_after = int((floor + cost - state["tokens"]) / REFILL_PER_SECOND) + 1
+        raise QuotaExhausted(
+            f"CheckWX {priority} quota exhausted ({state['tokens']:.0f} tokens left)",
+            retry_after
+        )
+    state["tokens"] -= cost
+    state["used"] += cost
+    return state
+
+
+def _acquire_db(priority: str, cost: int):
+    table = ApiQuota.__table__
+    now = _utcnow()
+    with db.engine.begin() as conn:
+        row = conn.execute(
+            select(table).where(table.c.name == QUOTA_NAME).with_for_update()
+        ).mappings().first()
+        if row is None:
+            state = _take(_new_state(now), priority, cost)
+            conn.execute(insert(table).values(name=QUOTA_NAME, **state))
+            return
+        state = _take(_refill(dict(row), now), priority, cost)
+        conn.execute(update(table).where(table.c.name == QUOTA_NAME).values(**state))
+
+
+def _acquire_local(priority: str, cost: int):
+    global _local
+    with _local_lock:
+        now = _utcnow()
+        state = _refill(_local, now) if _local else _new_state(now)
+        _local = _take(state, priority, cost)
+
+
+def acquire(priority: str = INTERACTIVE, cost: int = 1):
+    """
+    Spend `cost` CheckWX requests from the shared budget, or raise QuotaExhausted.
+    """
+    try:
+        try:
+            _acquire_db(priority, cost)
+        except IntegrityError:
+            # Two workers created the row at the same time, the second one just retries
+            _acquire_db(priority, cost)
+    except QuotaExhausted as e:
+        print(f"[checkwx_quota] {e}")
+        raise
+    except (SQLAlchemyError, RuntimeError) as e:
+        # No app context / table yet => keep counting in this process at least
+        print(f"[checkwx_quota] Shared bucket unavailable ({type(e).__name__}), using local bucket.")
+        _acquire_local(priority, cost)
+
+
+def get_status() -> dict:
+    """
+    Remaining budget, e.g.
+    {"remaining": 287, "background_available": 187, "used_today": 13, ...}
+    """
+    now = _utcnow()
+    state = None
+    try:
+        row = ApiQuota.query.get(QUOTA_NAME)
+        state = _refill(
+            {"tokens": row.tokens, "updated_at": row.updated_at, "day": row.day, "used": row.used},
+            now
+        ) if row else _new_state(now)
+    except SQLAlchemyError:
+        db.session.rollback()
+    except RuntimeError:
+        pass  # no app context
+
+    shared = state is not None
+    if not shared:
+        with _local_lock:
+            state = _refill(_local, now) if _local else _new_state(now)
+
+    return {
+        "daily_quota": CHECKWX_DAILY_QUOTA,
+        "burst": CHECKWX_BURST,
+        "background_reserve": CHECKWX_BACKGROUND_RESERVE,
+        "refill_per_hour": round(REFILL_PER_SECOND * 3600, 1),
+        "remaining": int(state["tokens"]),
+        "background_available": max(int(state["tokens"]) - CHECKWX_BACKGROUND_RESERVE, 0),
+        "used_today": state["used"],
+        "shared": shared
+    }
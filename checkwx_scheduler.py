@@ -0,0 +1,217 @@
+"""
+checkwx_scheduler.py
+
+All CheckWX station lookups go through a few dispatcher threads per process
+(CHECKWX_DISPATCHERS):
+
+  - callers queue ICAOs and wait on a Future per code,
+  - a dispatcher waits BATCH_WINDOW_SECONDS for more codes to arrive, then
+    asks for up to CHECKWX_BATCH_SIZE of them in a single multi-station
+    request (GET /station/ENGM,EGLL,...), interactive codes first,
+  - background-only batches may occupy all but one dispatcher, so a slow or
+    retrying preload batch can't hold up someone waiting interactively,
+  - each request is paid for from the shared budget (checkwx_quota.py):
+    interactive if anyone in the batch is waiting interactively, otherwise
+    background (which has to leave the reserve alone).
+
+So ten pilots filing ten new airports within the same moment cost one
+CheckWX request, and a preload can't starve someone opening the dashboard.
+
+Usage:
+    stations = lookup_stations(["ENGM", "ZZZZ"])  # {"ENGM": {...}, "ZZZZ": None}
+    stations = fetch_batch(chunk, BACKGROUND)      # one request, no queueing
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import nullcontext
+
+import requests
+from flask import current_app, has_app_context
+
+import upstream
+import checkwx_quota
+from checkwx_quota import INTERACTIVE, BACKGROUND
+
+# CheckWX accepts a comma-separated station list; keep each request reasonably small
+CHECKWX_BATCH_SIZE = 25
+# How long a dispatcher lets a batch fill up before sending it
+BATCH_WINDOW_SECONDS = 0.05
+# Batches in flight at once per process; one of them is kept for interactive work
+CHECKWX_DISPATCHERS = int(os.getenv("CHECKWX_DISPATCHERS", "3"))
+# How long a caller waits for its codes (queueing + retries included). Someone
+# is waiting on an interactive lookup, so it gives up after about one request.
+LOOKUP_TIMEOUT_SECONDS = {
+    INTERACTIVE: float(os.getenv("CHECKWX_INTERACTIVE_TIMEOUT", str(upstream.UPSTREAM_TIMEOUT + 2))),
+    BACKGROUND: upstream.UPSTREAM_TIMEOUT * (upstream.UPSTREAM_RETRIES + 1) + 5
+}
+
+_queue = {}  # ICAO -> {"future": Future, "priority": str, "since": float}
+_queue_cond = threading.Condition()
+_background_in_flight = 0
+_dispatchers = []
+_app = None
+
+
+def _fetch(icaos) -> dict:
+    """
+    One multi-station request. Returns {ICAO: station_data or None} for every
+    code asked for (None = CheckWX answered, but has no such station).
+    """
+    url = f"https://api.checkwx.com/station/{','.join(icaos)}"
+    headers = {"X-API-Key": os.getenv("CHECKWX_API_KEY") or ""}
+    print(f"[checkwx_scheduler] GET {url}")
+    resp = upstream.get("checkwx", url, headers=headers)
+    resp.raise_for_status()
+
+    payload = resp.json()
+    if not isinstance(payload, dict) or not isinstance(payload.get("data", []), list):
+        raise upstream.UpstreamError(f"Unexpected CheckWX payload: {str(payload)[:200]}")
+
+    found = {icao: None for icao in icaos}
+    for station in payload.get("data", []):
+        # Unknown codes come back as plain strings ("ZZZZ Invalid Station ICAO"), known ones as dicts
+        if isinstance(station, dict) and station.get("icao"):
+            found[station["icao"].upper()] = station
+    return found
+
+
+def fetch_batch(icaos, priority: str = INTERACTIVE) -> dict:
+    """
+    Send one multi-station request for `icaos` (at most CHECKWX_BATCH_SIZE)
+    right away, in the calling thread, paid from the `priority` budget.
+    For callers that do their own batching (preload_cache.py).
+    Returns {ICAO: station_data or None}; raises like lookup_stations().
+    """
+    checkwx_quota.acquire(priority)
+    return _fetch(icaos)
+
+
+def _can_take() -> bool:
+    """
+    Whether a free dispatcher should take a batch now: always for interactive
+    work, for background-only work while a dispatcher is left for interactive
+    lookups. Caller holds _queue_cond.
+    """
+    if any(e["priority"] == INTERACTIVE for e in _queue.values()):
+        return True
+    return bool(_queue) and _background_in_flight < max(CHECKWX_DISPATCHERS - 1, 1)
+
+
+def _next_batch():
+    """
+    Block until there's a batch this dispatcher may take, give it a moment to
+    fill up, then take up to CHECKWX_BATCH_SIZE codes (interactive first,
+    oldest first). Returns (batch, priority).
+    """
+    global _background_in_flight
+    while True:
+        with _queue_cond:
+            while not _can_take():
+                _queue_cond.wait()
+        time.sleep(BATCH_WINDOW_SECONDS)
+        with _queue_cond:
+            # Another dispatcher may have taken it meanwhile
+            if not _can_take():
+                continue
+            ordered = sorted(
+                _queue.items(),
+                key=lambda kv: (kv[1]["priority"] != INTERACTIVE, kv[1]["since"])
+            )[:CHECKWX_BATCH_SIZE]
+            for icao, _ in ordered:
+                del _queue[icao]
+            if any(e["priority"] == INTERACTIVE for _, e in ordered):
+                return ordered, INTERACTIVE
+            _background_in_flight += 1
+            return ordered, BACKGROUND
+
+
+def _dispatch(batch: list, priority: str):
+    icaos = [icao for icao, _ in batch]
+    try:
+        with _app.app_context() if _app else nullcontext():
+            checkwx_quota.acquire(priority)
+        found = _fetch(icaos)
+    except requests.RequestException as e:
+        for _, entry in batch:
+            entry["future"].set_exception(e)
+        return
+    except Exception as e:
+        # Callers (and the routes) know what to do with RequestExceptions, not with a stray KeyError
+        print(f"[checkwx_scheduler] Lookup of {','.join(icaos)} failed: {e!r}")
+        error = upstream.UpstreamError(f"CheckWX lookup failed: {e}")
+        for _, entry in batch:
+            entry["future"].set_exception(error)
+        return
+    for icao, entry in batch:
+        entry["future"].set_result(found.get(icao))
+
+
+def _run():
+    global _background_in_flight
+    while True:
+        batch, priority = _next_batch()
+        try:
+            _dispatch(batch, priority)
+        except Exception as e:
+            print(f"[checkwx_scheduler] Dispatcher error: {e}")
+        finally:
+            if priority == BACKGROUND:
+                with _queue_cond:
+                    _background_in_flight -= 1
+                    _queue_cond.notify()
+
+
+def _ensure_dispatcher():
+    """
+    Start the dispatchers on first use. Caller holds _queue_cond.
+    """
+    global _app
+    if _dispatchers:
+        return
+    if has_app_context():
+        _app = current_app._get_current_object()
+    for i in range(max(CHECKWX_DISPATCHERS, 1)):
+        thread = threading.Thread(target=_run, name=f"checkwx-scheduler-{i}", daemon=True)
+        thread.start()
+        _dispatchers.append(thread)
+
+
+def lookup_stations(icaos, priority: str = INTERACTIVE) -> dict:
+    """
+    Look up station records for `icaos` via the shared dispatcher.
+    Returns {ICAO: station_data or None} for every code CheckWX answered for
+    (None = no such station). Codes whose request failed are left out.
+    Raises upstream.UpstreamUnavailable (incl. checkwx_quota.QuotaExhausted)
+    if the circuit is open or the budget is used up, and for interactive
+    lookups that aren't answered within LOOKUP_TIMEOUT_SECONDS.
+    """
+    now = time.monotonic()
+    futures = {}
+    with _queue_cond:
+        _ensure_dispatcher()
+        for icao in icaos:
+            entry = _queue.get(icao)
+            if entry is None:
+                entry = _queue[icao] = {"future": Future(), "priority": priority, "since": now}
+            elif priority == INTERACTIVE:
+                entry["priority"] = INTERACTIVE  # someone is waiting now, move it up
+            futures[icao] = entry["future"]
+        _queue_cond.notify()
+
+    deadline = now + LOOKUP_TIMEOUT_SECONDS[priority]
+    result = {}
+    for icao, fut in futures.items():
+        try:
+            result[icao] = fut.result(timeout=max(deadline - time.monotonic(), 0))
+        except upstream.UpstreamUnavailable:
+            raise
+        except FutureTimeout:
+            print(f"[checkwx_scheduler] Timed out waiting for {icao}")
+            if priority == INTERACTIVE:
+                raise upstream.UpstreamUnavailable("CheckWX lookup timed out")
+        except requests.RequestException as e:
+            print(f"[checkwx_scheduler] CheckWX error for {icao}: {e}")
+    return result
@@ -0,0 +1,89 @@
+"""
+coord_cache.py
+
+Process-local LRU of ICAO -> (lat, lon, name) in front of the airport table.
+
+Airport coordinates practically never change, so /api/distance and friends
+shouldn't need a DB round-trip for them. The cache is warmed from the table
+at startup, bounded to COORD_CACHE_SIZE entries, and entries are dropped by
+the airport update/delete routes. That only clears the worker that handled
+the request, so entries also expire after COORD_CACHE_TTL_SECONDS: other
+workers pick up an edited or deleted airport within that long.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models.airport import Airport
+
+COORD_CACHE_SIZE = int(os.getenv("COORD_CACHE_SIZE", "10000"))
+COORD_CACHE_TTL_SECONDS = int(os.getenv("COORD_CACHE_TTL_SECONDS", "600"))
+
+_cache = OrderedDict()  # ICAO -> (expires_at, (lat, lon, name))
+_hits = 0
+_misses = 0
+_cache_lock = threading.Lock()
+
+
+def get(icao: str):
+    """
+    Return (lat, lon, name) for `icao`, or None on a miss (or an expired entry).
+    """
+    global _hits, _misses
+    with _cache_lock:
+        entry = _cache.get(icao)
+        if entry is not None and entry[0] <= time.monotonic():
+            del _cache[icao]
+            entry = None
+        if entry is None:
+            _misses += 1
+            return None
+        _cache.move_to_end(icao)
+        _hits += 1
+        return entry[1]
+
+
+def put(icao: str, lat, lon, name=None):
+    if lat is None or lon is None:
+        return
+    with _cache_lock:
+        _cache[icao] = (time.monotonic() + COORD_CACHE_TTL_SECONDS, (float(lat), float(lon), name))
+        _cache.move_to_end(icao)
+        while len(_cache) > COORD_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def invalidate(icao: str):
+    with _cache_lock:
+        _cache.pop(icao, None)
+
+
+def warm():
+    """
+    Fill the cache from the airport table (needs an app context).
+    """
+    rows = (
+        Airport.query
+        .with_entities(Airport.icao, Airport.latitude, Airport.longitude, Airport.name)
+        .filter(Airport.latitude.isnot(None), Airport.longitude.isnot(None))
+        .limit(COORD_CACHE_SIZE)
+        .all()
+    )
+    for icao, lat, lon, name in rows:
+        put(icao, lat, lon, name)
+    print(f"[coord_cache] Warmed with {len(rows)} airports.")
+
+
+def get_stats() -> dict:
+    with _cache_lock:
+        total = _hits + _misses
+        return {
+            "size": len(_cache),
+            "max_size": COORD_CACHE_SIZE,
+            "ttl_seconds": COORD_CACHE_TTL_SECONDS,
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / total, 3) if total else None
+        }
@@ -1,6 +1,10 @@
 # db.py
 import os
+from dotenv import load_dotenv
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 # We'll instantiate db here, but not bind it to an app just yet.
 db = SQLAlchemy()
@@ -14,4 +18,28 @@ def init_db_uri(app):
     db_path = os.path.join(base_dir, "data/aircraft.db")
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    return app
\ No newline at end of file
+    return app
+
+
+def create_cli_app(name: str):
+    """
+    A bare Flask app with only the database configured, for command-line
+    scripts (preload_cache.py, import_legacy_cache.py) that need the models
+    but not the web app's Influx client, pollers and caches.
+    """
+    load_dotenv()
+    app = init_db_uri(Flask(name))
+    db.init_app(app)
+    return app
+
+
+def insert_ignore_existing(model, rows: list):
+    """
+    Bulk `INSERT ... ON CONFLICT DO NOTHING` of `rows` (list of column dicts)
+    into `model`'s table, in the current session. Rows that clash with an
+    existing primary key/unique value are left as they are. Caller commits.
+    """
+    if not rows:
+        return
+    insert = pg_insert if db.engine.dialect.name == "postgresql" else sqlite_insert
+    db.session.execute(insert(model).values(rows).on_conflict_do_nothing())
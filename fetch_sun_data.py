@@ -3,34 +3,53 @@
 """
 fetch_sun_data.py
 
-A simple Python script to fetch sunrise/sunset data for every day of a chosen year
-from the MET Norway Sunrise 3.0 API, for Stavanger, Norway.
+Build the pre-fetched sunrise/sunset tables (see sun_table.py) from the MET
+Norway Sunrise 3.0 API, for any of the named locations in
+sun_table.LOCATIONS and any range of years.
+
+Each day is one request; all (location, day) requests share a pool of
+SUN_WORKERS threads, paced to at most MET_MAX_RPS requests per second
+(MET asks for no more than 20/s per application, with an identifying
+User-Agent). Failed days are retried with backoff, every attempt waiting
+for its pacing slot (a plain session, so nothing retries behind the
+pacer's back). Finished days are
+checkpointed to data/sun/<location>-<year>.partial.json, so an interrupted
+run picks up where it stopped; a location/year that's already built is
+skipped unless --force is given.
+
+Each location/year ends up as data/sun/<location>-<year>.json:
+  {"location": "stavanger", "year": 2025, "tz": "Europe/Oslo", "lat": ..., "lon": ...,
+   "start": "2025-01-01", "sunrise": ["09:28", ...], "sunset": ["15:50", ...]}
+with times in local (DST-aware) time and null where the sun doesn't rise/set.
 
 Usage:
-  python fetch_sun_data.py 2025
-Outputs:
-  A file 'sun_data.json' with an array of:
-  [
-    {
-      "date": "YYYY-MM-DD",
-      "sunrise": "HH:MM",
-      "sunset": "HH:MM"
-    },
-    ...
-  ]
+  python fetch_sun_data.py 2025                       # Stavanger, 2025
+  python fetch_sun_data.py 2024-2026 oslo tromso      # years x locations
+  python fetch_sun_data.py 2025 all --force           # every location, rebuild
 """
 
-import sys
 import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
 import requests
-from datetime import date, timedelta
+from requests.adapters import HTTPAdapter
+
+from sun_table import LOCATIONS, DEFAULT_LOCATION, SUN_DIR, artifact_path
 
-# Coordinates for Stavanger, Norway
-LAT = 58.970052
-LON = 5.733395
+SUNRISE_URL = "https://api.met.no/weatherapi/sunrise/3.0/sun"
 
-# Default to +01:00 (might be off during summer DST).
-OFFSET = "+01:00"
+SUN_WORKERS = int(os.getenv("SUN_WORKERS", "16"))
+MET_MAX_RPS = float(os.getenv("MET_MAX_RPS", "15"))
+MAX_ATTEMPTS = 4
+REQUEST_TIMEOUT = 10
+# Write the .partial checkpoint every this many finished days
+CHECKPOINT_EVERY = 50
 
 # "User-Agent" header required by MET Norway
 HEADERS = {
@@ -38,93 +57,197 @@ HEADERS = {
     "Accept": "application/json"
 }
 
-def fetch_sunrise_one_day(yyyy_mm_dd):
-    """
-    Fetch sunrise/sunset for a single date string (YYYY-MM-DD) from MET Sunrise 3.0 ("/sun").
-    Returns (sunrise_str, sunset_str) in "HH:MM" 24-hour format.
-    """
-    url = (
-        "https://api.met.no/weatherapi/sunrise/3.0/sun"
-        f"?lat={LAT}&lon={LON}&date={yyyy_mm_dd}&offset={OFFSET}"
-    )
+_pace_lock = threading.Lock()
+_next_slot = 0.0
 
-    resp = requests.get(url, headers=HEADERS)
-    if not resp.ok:
-        raise RuntimeError(f"Sunrise API failed for {yyyy_mm_dd}: {resp.status_code}")
+# Not upstream.get(): its own retries would skip _wait_for_slot()
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=SUN_WORKERS, max_retries=0))
 
-    data = resp.json()
-    if data.get("type") != "Feature":
-        raise ValueError(f"Unexpected format for {yyyy_mm_dd}: {data}")
 
-    sunrise_iso = data.get("properties", {}).get("sunrise", {}).get("time")
-    sunset_iso = data.get("properties", {}).get("sunset", {}).get("time")
+def _wait_for_slot():
+    """
+    Space requests 1/MET_MAX_RPS apart across all workers.
+    """
+    global _next_slot
+    with _pace_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot)
+        _next_slot = slot + 1.0 / MET_MAX_RPS
+    if slot > now:
+        time.sleep(slot - now)
 
-    sunrise_str = "00:00"
-    sunset_str = "00:00"
 
-    if sunrise_iso:
-        sr_dt = parse_iso_to_datetime(sunrise_iso)
-        sunrise_str = sr_dt.strftime("%H:%M")
-    if sunset_iso:
-        ss_dt = parse_iso_to_datetime(sunset_iso)
-        sunset_str = ss_dt.strftime("%H:%M")
+def _hhmm(iso_str):
+    if not iso_str:
+        return None
+    return datetime.fromisoformat(iso_str).strftime("%H:%M")
 
-    return sunrise_str, sunset_str
 
-def parse_iso_to_datetime(iso_str):
+def fetch_sunrise_one_day(lat, lon, tz: ZoneInfo, day: date):
     """
-    Convert ISO datetime string (e.g. "2025-06-01T04:12:00+01:00") to a Python datetime.
+    Sunrise/sunset for one day, as local "HH:MM" strings (None if the sun
+    doesn't rise/set). Asks MET for the offset in effect at local noon, so
+    the times come back in DST-aware local time.
     """
-    # Python 3.11+ can parse the offset natively with strptime and %z,
-    # but for broad compatibility, let's use fromisoformat (3.7+).
-    return dateutil_parser(iso_str)
+    noon = datetime(day.year, day.month, day.day, 12, tzinfo=tz)
+    offset = noon.strftime("%z")
+    offset = f"{offset[:3]}:{offset[3:]}"
 
-def dateutil_parser(iso_str):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        _wait_for_slot()
+        try:
+            resp = _session.get(SUNRISE_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT, params={
+                "lat": lat, "lon": lon, "date": day.isoformat(), "offset": offset
+            })
+            if resp.status_code == 429 or resp.status_code >= 500:
+                raise requests.HTTPError(f"HTTP {resp.status_code}", response=resp)
+            resp.raise_for_status()
+            data = resp.json()
+            if data.get("type") != "Feature":
+                raise ValueError(f"Unexpected format: {data}")
+            props = data.get("properties", {})
+            return _hhmm((props.get("sunrise") or {}).get("time")), _hhmm((props.get("sunset") or {}).get("time"))
+        except (requests.RequestException, ValueError) as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+            time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt)
+
+
+class _Job:
     """
-    Minimal fallback if you don't have dateutil:
-    - For Python 3.11+, you can do: datetime.fromisoformat(iso_str)
-    - For older versions or portability, we can do a quick parse.
-    Here, let's assume the user has 'datetime.fromisoformat' (Python 3.7+).
-    If that doesn't work, install python-dateutil or adapt as needed.
+    One location/year: its days, what's done so far and its checkpoint file.
     """
-    from datetime import datetime
-    return datetime.fromisoformat(iso_str)
+
+    def __init__(self, location: str, year: int):
+        self.location = location
+        self.year = year
+        self.lat, self.lon, tz_name = LOCATIONS[location]
+        self.tz_name = tz_name
+        self.tz = ZoneInfo(tz_name)
+        self.path = artifact_path(location, year)
+        self.partial_path = self.path.with_name(f"{location}-{year}.partial.json")
+        self.start = date(year, 1, 1)
+        self.days = [self.start + timedelta(days=i) for i in range((date(year + 1, 1, 1) - self.start).days)]
+        self.done = {}  # "YYYY-MM-DD" -> [sunrise, sunset]
+        self.failed = 0
+        self.lock = threading.Lock()
+        if self.partial_path.exists():
+            try:
+                with open(self.partial_path, "r", encoding="utf-8") as f:
+                    self.done = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[fetch_sun_data] Ignoring unreadable {self.partial_path.name}: {e}")
+
+    def pending(self):
+        return [d for d in self.days if d.isoformat() not in self.done]
+
+    def record(self, day: date, times):
+        with self.lock:
+            self.done[day.isoformat()] = list(times)
+            if len(self.done) % CHECKPOINT_EVERY == 0:
+                self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Caller holds self.lock (or no workers are running anymore).
+        """
+        _write_json(self.partial_path, self.done)
+
+    def finish(self) -> bool:
+        if len(self.done) < len(self.days):
+            self.checkpoint()
+            print(f"[fetch_sun_data] {self.path.name}: {len(self.days) - len(self.done)} days missing, "
+                  f"kept {self.partial_path.name} for the next run.")
+            return False
+        keys = [d.isoformat() for d in self.days]
+        _write_json(self.path, {
+            "location": self.location,
+            "year": self.year,
+            "tz": self.tz_name,
+            "lat": self.lat,
+            "lon": self.lon,
+            "start": self.start.isoformat(),
+            "sunrise": [self.done[k][0] for k in keys],
+            "sunset": [self.done[k][1] for k in keys]
+        })
+        if self.partial_path.exists():
+            os.remove(self.partial_path)
+        print(f"[fetch_sun_data] Wrote {self.path.name} ({len(keys)} days).")
+        return True
+
+
+def _write_json(path, doc):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(doc, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _parse_years(arg: str) -> list:
+    if "-" in arg:
+        first, last = arg.split("-", 1)
+        return list(range(int(first), int(last) + 1))
+    return [int(arg)]
+
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python fetch_sun_data.py <YEAR>")
+    args = [a for a in sys.argv[1:] if a != "--force"]
+    force = "--force" in sys.argv[1:]
+    if not args:
+        print("Usage: python fetch_sun_data.py <YEAR | FIRST-LAST> [location ... | all] [--force]")
+        print(f"Locations: {', '.join(LOCATIONS)}")
         sys.exit(1)
 
-    year = int(sys.argv[1])
-    start_date = date(year, 1, 1)
-    end_date = date(year, 12, 31)
+    years = _parse_years(args[0])
+    names = args[1:] or [DEFAULT_LOCATION]
+    if names == ["all"]:
+        names = list(LOCATIONS)
+    unknown = [n for n in names if n not in LOCATIONS]
+    if unknown:
+        print(f"Unknown location(s): {', '.join(unknown)}. Known: {', '.join(LOCATIONS)}")
+        sys.exit(1)
 
-    all_data = []
-    current = start_date
-    while current <= end_date:
-        yyyy_mm_dd = current.isoformat()  # "YYYY-MM-DD"
-        print(f"Fetching for {yyyy_mm_dd} ...", end=" ")
+    jobs = []
+    for name in names:
+        for year in years:
+            if artifact_path(name, year).exists() and not force:
+                print(f"[fetch_sun_data] {artifact_path(name, year).name} exists, skipping (--force to rebuild).")
+                continue
+            jobs.append(_Job(name, year))
+
+    tasks = [(job, day) for job in jobs for day in job.pending()]
+    print(f"[fetch_sun_data] {len(jobs)} location-years, {len(tasks)} days to fetch "
+          f"({SUN_WORKERS} workers, <= {MET_MAX_RPS:g} req/s) into {SUN_DIR}")
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=SUN_WORKERS) as pool:
+        futures = {
+            pool.submit(fetch_sunrise_one_day, job.lat, job.lon, job.tz, day): (job, day)
+            for job, day in tasks
+        }
         try:
-            sunrise, sunset = fetch_sunrise_one_day(yyyy_mm_dd)
-            all_data.append({
-                "date": yyyy_mm_dd,
-                "sunrise": sunrise,
-                "sunset": sunset
-            })
-            print("OK")
-        except Exception as e:
-            print(f"Error: {e}")
-
-        current += timedelta(days=1)
-
-    # Write to sun_data.json
-    with open("sun_data.json", "w", encoding="utf-8") as f:
-        json.dump(all_data, f, indent=2)
+            for fut in as_completed(futures):
+                job, day = futures[fut]
+                try:
+                    job.record(day, fut.result())
+                except Exception as e:
+                    job.failed += 1
+                    print(f"[fetch_sun_data] {job.location} {day}: giving up: {e}")
+        except KeyboardInterrupt:
+            print("[fetch_sun_data] Interrupted, saving progress.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            for job in jobs:
+                with job.lock:
+                    job.checkpoint()
+            raise
+
+    built = sum(job.finish() for job in jobs)
+    print(f"[fetch_sun_data] Done in {time.monotonic() - started:.1f}s: "
+          f"{built}/{len(jobs)} location-years complete.")
 
-    print(f"Done. Wrote {len(all_data)} entries to sun_data.json.")
 
 if __name__ == "__main__":
-    # If you rely on python-dateutil, add "import dateutil.parser"
-    # or adapt parse logic for older Pythons.
-    # For Python 3.7+ with fromisoformat, the above fallback should be enough.
-    main()
\ No newline at end of file
+    main()
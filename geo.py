@@ -0,0 +1,43 @@
+"""
+geo.py
+
+Great-circle helpers shared by the routes.
+"""
+
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_NM = 1.852
+
+
+def distance_nm(lat1, lon1, lat2, lon2):
+    """
+    Haversine distance between two lat/lon points, in nautical miles.
+    """
+    toRad = math.pi / 180.0
+    dLat = (lat2 - lat1) * toRad
+    dLon = (lon2 - lon1) * toRad
+    a = (math.sin(dLat / 2) ** 2
+         + math.cos(lat1 * toRad) * math.cos(lat2 * toRad)
+         * math.sin(dLon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    dist_km = EARTH_RADIUS_KM * c
+    return dist_km / KM_PER_NM
+
+
+def distance_matrix_nm(lats1, lons1, lats2, lons2):
+    """
+    Vectorized haversine: distances (nm) from each of N points (lats1/lons1)
+    to each of M points (lats2/lons2), as an N x M NumPy array, in one pass.
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=float))[None, :]
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c / KM_PER_NM
@@ -0,0 +1,92 @@
+"""
+http_cache.py
+
+Validators and compression for every JSON response.
+
+init_http_cache(app) registers an after_request hook that, for successful
+GET/HEAD JSON responses:
+  1) sets a content-hash ETag and answers `If-None-Match` with 304,
+  2) compresses the body with brotli or gzip (whichever the client prefers),
+     if it's big enough to be worth it.
+
+Compressed bodies are cached by (ETag, encoding), so a large list that many
+clients fetch unchanged (e.g. GET /api/airport) is only compressed once.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+
+import brotli
+from flask import request
+from werkzeug.http import generate_etag
+
+# Don't bother compressing tiny bodies
+COMPRESS_MIN_BYTES = 1024
+
+# How many compressed bodies to keep (LRU, keyed by ETag + encoding)
+COMPRESSED_CACHE_SIZE = 128
+
+_compressed = OrderedDict()
+_compressed_lock = threading.Lock()
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _get_compressed(etag: str, body: bytes, encoding: str) -> bytes:
+    key = (etag, encoding)
+    with _compressed_lock:
+        cached = _compressed.get(key)
+        if cached is not None:
+            _compressed.move_to_end(key)
+            return cached
+
+    compressed = _compress(body, encoding)
+
+    with _compressed_lock:
+        _compressed[key] = compressed
+        while len(_compressed) > COMPRESSED_CACHE_SIZE:
+            _compressed.popitem(last=False)
+    return compressed
+
+
+def _apply_http_cache(response):
+    if request.method not in ("GET", "HEAD"):
+        return response
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+    if response.mimetype != "application/json" or "Content-Encoding" in response.headers:
+        return response
+
+    body = response.get_data()
+
+    # Weak, because the same content goes out under different Content-Encodings
+    etag = generate_etag(body)
+    response.set_etag(etag, weak=True)
+    response.vary.add("Accept-Encoding")
+
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = request.accept_encodings.best_match(["br", "gzip"])
+    if not encoding:
+        return response
+
+    response.set_data(_get_compressed(etag, body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_http_cache(app):
+    """
+    Register the ETag/compression hook on the Flask app.
+    """
+    app.after_request(_apply_http_cache)
+    return app
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+import_legacy_cache.py
+
+One-off import of the legacy JSON caches into the database:
+
+  data/airportDb.json   (airport_cache.py, CheckWX station records by ICAO)  -> `airport`
+                        (or airportDb.snap + journal, once airport_cache.py has converted it)
+  data/aircraftDb.json  (aircraft_cache.py, aircraft records by registration) -> `aircraft`
+
+The files are streamed (one record at a time, never the whole document in
+memory) and written in batches of BATCH_SIZE with INSERT ... ON CONFLICT DO
+NOTHING, so rows already in the table win and the import can be re-run.
+
+Top-level columns are derived the same way the API does it: airports via
+airport_from_station(), aircraft from the POST /api/aircraft fields, with
+`type` matched to aircraft_type.type_code (or type_designator) and
+`operator` to airline.name (or icao_code). Aircraft whose type or operator
+isn't in the DB are skipped and counted.
+
+Usage:
+  python import_legacy_cache.py              # both files
+  python import_legacy_cache.py airports     # just one of them
+  python import_legacy_cache.py aircraft
+"""
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from db import db, insert_ignore_existing, create_cli_app
+from models.airport import Airport
+from models.aircraft import Aircraft
+from models.aircraft_type import AircraftType
+from models.airline import Airline
+from models.airline_hub import AirlineHub  # Airline.hubs needs it mapped
+from routes.airport_routes import airport_from_station
+from airport_snapshot import AirportSnapshotJournal
+
+# Just the DB and the models, not the web app (no Influx, pollers or cache warm-up)
+app = create_cli_app(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+AIRPORT_JSON = DATA_DIR / "airportDb.json"
+AIRPORT_SNAPSHOT = DATA_DIR / "airportDb.snap"  # airport_cache.py's binary snapshot, if it has made one
+AIRCRAFT_JSON = DATA_DIR / "aircraftDb.json"
+
+BATCH_SIZE = 500
+READ_CHUNK = 64 * 1024
+# What can follow a complete JSON value
+VALUE_DELIMITERS = ",:]} \t\r\n"
+
+
+def iter_json_items(path: Path):
+    """
+    Stream the entries of a top-level JSON object ({key: value, ...}) as
+    (key, value) pairs, or of a top-level array as (None, value), decoding
+    one value at a time with JSONDecoder.raw_decode.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # A number may continue in the next chunk ("3." + "5e10"), so only
+                    # take a value once we've seen what comes after it (or the file ends)
+                    if eof or (end < len(buf) and buf[end] in VALUE_DELIMITERS):
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        def expect(chars):
+            nonlocal pos
+            skip_ws()
+            if pos >= len(buf) or buf[pos] not in chars:
+                raise ValueError(f"{path}: expected one of {chars!r} near offset {pos}")
+            pos += 1
+            return buf[pos - 1]
+
+        opening = expect("{[")
+        closing = "}" if opening == "{" else "]"
+        skip_ws()
+        if pos < len(buf) and buf[pos] == closing:
+            return
+        while True:
+            skip_ws()
+            key = None
+            if opening == "{":
+                key = decode()
+                expect(":")
+                skip_ws()
+            yield key, decode()
+            if expect("," + closing) == closing:
+                return
+
+
+def _int_or_none(raw):
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _date_or_none(raw):
+    """
+    Delivery dates come as "2020.10.15" (or ISO "2020-10-15").
+    """
+    if not raw or not isinstance(raw, str):
+        return None
+    for fmt in ("%Y.%m.%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(raw.strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def iter_airport_records(path: Path = AIRPORT_JSON):
+    """
+    (icao, record) pairs from airport_cache.py's store: its binary snapshot +
+    journal if it has converted the JSON file already (records are decoded one
+    at a time), else the JSON file itself.
+    """
+    if AIRPORT_SNAPSHOT.exists():
+        # read(), not load(): the web app owns these files, we must not compact or rewrite them
+        data = AirportSnapshotJournal(path, AIRPORT_SNAPSHOT, "import").read()
+        for key in data:
+            yield key, data[key]
+    else:
+        yield from iter_json_items(path)
+
+
+def import_airports(path: Path = AIRPORT_JSON):
+    if not path.exists() and not AIRPORT_SNAPSHOT.exists():
+        print(f"[import] {path} not found, skipping airports.")
+        return
+    columns = [c.name for c in Airport.__table__.columns]
+    rows = []
+    seen = skipped = 0
+
+    def flush():
+        insert_ignore_existing(Airport, rows)
+        db.session.commit()
+        rows.clear()
+
+    for key, station in iter_airport_records(path):
+        seen += 1
+        icao = (station.get("icao") or key or "").strip().upper() if isinstance(station, dict) else ""
+        if not icao:
+            skipped += 1
+            continue
+        ap = airport_from_station(icao, station)
+        rows.append({col: getattr(ap, col) for col in columns})
+        if len(rows) >= BATCH_SIZE:
+            flush()
+    flush()
+    print(f"[import] Airports: {seen} records read, {seen - skipped} offered to the DB, {skipped} skipped.")
+
+
+def import_aircraft(path: Path = AIRCRAFT_JSON):
+    if not path.exists():
+        print(f"[import] {path} not found, skipping aircraft.")
+        return
+
+    types = {}
+    for t in AircraftType.query.all():
+        types[t.type_code.upper()] = t.id
+        if t.type_designator:
+            types.setdefault(t.type_designator.upper(), t.id)
+    operators = {}
+    for a in Airline.query.all():
+        operators[a.name.strip().lower()] = a.id
+        operators.setdefault(a.icao_code.strip().lower(), a.id)
+
+    rows = []
+    seen = 0
+    unresolved = {"registration": 0, "type": 0, "operator": 0}
+
+    def flush():
+        insert_ignore_existing(Aircraft, rows)
+        db.session.commit()
+        rows.clear()
+
+    for key, rec in iter_json_items(path):
+        seen += 1
+        if not isinstance(rec, dict):
+            unresolved["registration"] += 1
+            continue
+        reg = (rec.get("registration") or key or "").strip().upper()
+        type_id = types.get(str(rec.get("type") or "").strip().upper())
+        operator_id = operators.get(str(rec.get("operator") or "").strip().lower())
+        if not reg:
+            unresolved["registration"] += 1
+            continue
+        if type_id is None:
+            unresolved["type"] += 1
+            continue
+        if operator_id is None:
+            unresolved["operator"] += 1
+            continue
+
+        rows.append({
+            "registration": reg,
+            "normalized_registration": reg.replace("-", ""),
+            "icao24": rec.get("icao24"),
+            "selcal": rec.get("selcal"),
+            "type_id": type_id,
+            "operator_id": operator_id,
+            "serial_number": rec.get("serial_number") or rec.get("serialNumber"),
+            "year_built": _int_or_none(rec.get("built", rec.get("year_built"))),
+            "status": rec.get("status"),
+            "name": rec.get("name"),
+            "construction_number": _int_or_none(rec.get("cn")),
+            "test_reg": rec.get("testreg"),
+            "delivery_date": _date_or_none(rec.get("delivery")),
+            "remarks_json": rec.get("remarks"),
+            "previous_reg_json": rec.get("previous-reg"),
+        })
+        if len(rows) >= BATCH_SIZE:
+            flush()
+    flush()
+    skipped = sum(unresolved.values())
+    print(f"[import] Aircraft: {seen} records read, {seen - skipped} offered to the DB, "
+          f"skipped {unresolved['registration']} without registration, "
+          f"{unresolved['type']} with unknown type, {unresolved['operator']} with unknown operator.")
+
+
+def main():
+    which = sys.argv[1:] or ["airports", "aircraft"]
+    with app.app_context():
+        if "airports" in which:
+            import_airports()
+        if "aircraft" in which:
+            import_aircraft()
+
+
+if __name__ == "__main__":
+    main()
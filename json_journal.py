@@ -0,0 +1,214 @@
+"""
+json_journal.py
+
+A dict persisted as a JSON snapshot plus an append-only change journal,
+for the legacy file caches (airport_cache.py, aircraft_cache.py).
+
+  data/airportDb.json           snapshot, a plain JSON object {key: record}
+  data/airportDb.json.journal   one JSON line per change since the snapshot:
+                                  {"op": "put", "key": "ENGM", "value": {...}}
+                                  {"op": "del", "key": "ENGM"}
+
+A write appends one line (O(record), not O(file)). A crash can at worst
+leave a truncated last line, which load() skips. Once the journal has
+COMPACT_AFTER_ENTRIES lines, a background thread writes a fresh snapshot
+(temp file + os.replace, so readers never see half a file) and empties the
+journal. The snapshot stays plain JSON, so anything reading the old file
+format still works.
+
+Every gunicorn worker (and the importer) has the same files open, so appends,
+loads and compactions hold an flock on data/<file>.journal.lock. A
+compaction builds the new snapshot from what's on disk (the snapshot plus
+every journal line, whichever process wrote it), not from its own process's
+memory, then truncates the journal in place: the other processes' append
+handles point at the same file and keep working.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Rewrite the snapshot once the journal has this many entries
+COMPACT_AFTER_ENTRIES = 500
+
+
+class JsonJournal:
+    def __init__(self, path: Path, name: str):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        # Left behind by older versions, which renamed the journal while compacting
+        self.compacting_path = self.path.with_name(self.path.name + ".journal.old")
+        self.lock_path = self.path.with_name(self.path.name + ".journal.lock")
+        self.name = name
+        self.data = {}
+        self._entries = 0
+        self._journal = None
+        self._compacting = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock shared with the other processes using these files.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def load(self) -> dict:
+        """
+        Read the snapshot and replay the journal(s) on top. Returns self.data.
+        """
+        with self._file_lock():
+            data = self._read_snapshot()
+            replayed = self._replay(self.compacting_path, data)
+            self._entries = self._replay(self.journal_path, data)
+        with self._lock:
+            self.data = data
+        print(f"[{self.name}] Loaded {len(data)} entries "
+              f"(+{replayed + self._entries} journal entries).")
+        if replayed or self._entries >= COMPACT_AFTER_ENTRIES:
+            self._start_compaction()
+        return self.data
+
+    def read(self):
+        """
+        The state on disk (snapshot + journals), for a process that only
+        reads the store (import_legacy_cache.py): nothing is compacted,
+        repaired or rebuilt, and self.data isn't touched.
+        """
+        with self._file_lock():
+            data = self._read_snapshot(rebuild=False)
+            self._replay(self.compacting_path, data, repair=False)
+            self._replay(self.journal_path, data, repair=False)
+        return data
+
+    def _read_snapshot(self, rebuild: bool = True):
+        """
+        The state as of the last compaction. Subclasses can swap the format,
+        anything dict-like (get/[]=/pop/len) works. With rebuild=False nothing
+        may be written.
+        """
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[{self.name}] Error reading {self.path.name}, starting from the journal only: {e}")
+            return {}
+
+    def _write_snapshot(self, snapshot):
+        """
+        Atomically replace the snapshot file with `snapshot`.
+        """
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def _replay(self, path: Path, data, repair: bool = True) -> int:
+        """
+        Apply the journal at `path` to `data`. Caller holds the file lock.
+        """
+        if not path.exists():
+            return 0
+        with open(path, "rb") as f:
+            raw = f.read()
+
+        # A crash mid-append leaves a last line without "\n"; cut it off, so the
+        # next append doesn't get glued onto it
+        complete = raw.rfind(b"\n") + 1
+        if complete < len(raw):
+            print(f"[{self.name}] Ignoring truncated last line of {path.name}.")
+            if repair:
+                with open(path, "r+b") as f:
+                    f.truncate(complete)
+
+        count = 0
+        for i, line in enumerate(raw[:complete].splitlines()):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"[{self.name}] Skipping unreadable line {i + 1} of {path.name}.")
+                continue
+            if entry.get("op") == "put":
+                data[entry["key"]] = entry["value"]
+            elif entry.get("op") == "del":
+                data.pop(entry["key"], None)
+            count += 1
+        return count
+
+    def _append(self, entry: dict):
+        """
+        Append one change to the journal. Caller holds self._lock.
+        """
+        with self._file_lock():
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._journal.flush()
+        self._entries += 1
+
+    def put(self, key: str, value):
+        with self._lock:
+            self.data[key] = value
+            self._append({"op": "put", "key": key, "value": value})
+            compact = self._entries >= COMPACT_AFTER_ENTRIES
+        if compact:
+            self._start_compaction()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self.data:
+                return False
+            del self.data[key]
+            self._append({"op": "del", "key": key})
+            compact = self._entries >= COMPACT_AFTER_ENTRIES
+        if compact:
+            self._start_compaction()
+        return True
+
+    def _start_compaction(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+        threading.Thread(target=self.compact, name=f"{self.name}-compact", daemon=True).start()
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot and empty it. The snapshot is
+        built from the files, so other processes' writes are kept; this
+        process's self.data is left as it is.
+        """
+        try:
+            # Only the file lock: put()/delete() take self._lock first, then this one
+            with self._file_lock():
+                data = self._read_snapshot()
+                self._replay(self.compacting_path, data)
+                self._replay(self.journal_path, data)
+                self._write_snapshot(data)
+                # Truncate rather than replace: the other processes' append handles stay valid
+                if self.journal_path.exists():
+                    os.truncate(self.journal_path, 0)
+                if self.compacting_path.exists():
+                    os.remove(self.compacting_path)
+            with self._lock:
+                self._entries = 0
+            print(f"[{self.name}] Compacted to {len(data)} entries.")
+        except Exception as e:
+            print(f"[{self.name}] Compaction failed, journal kept: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
@@ -0,0 +1,261 @@
+"""
+metar_history.py
+
+In-memory window of the last 24 h of METAR rows per station, for /api/enzv.
+
+The first request for a station runs the full 24 h Flux query once; after
+that the window is only topped up with the rows newer than the last one we
+have (range(start: <last_seen>)), at most once per REFRESH_SECONDS, and rows
+older than WINDOW_SECONDS fall off the front. Requests are served from
+memory, so Influx load is one small delta query per minute per station,
+however many dashboards are open.
+
+If a top-up fails the window we have keeps being served (and the next
+request after REFRESH_SECONDS tries again).
+
+Longer ranges go through get_downsampled(): each field is reduced in Flux
+with aggregateWindow (its own function, see FIELD_AGGREGATES), the streams
+are union()ed and pivoted into one row per window, so a 30-day chart is a
+few hundred rows instead of every METAR. Results are kept for
+RESULT_TTL_SECONDS, so dashboards polling the same view share one query.
+
+Usage:
+    configure(query_api, INFLUX_BUCKET)               # once, at startup
+    rows = get_rows("ENZV")                           # time-ascending list of row dicts
+    rows = get_downsampled("ENZV", "7d", "30m")       # one row per 30 min
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+METAR_FIELDS = [
+    "altim_hpa",
+    "altim_in_hg",
+    "dewpoint_c",
+    "temp_c",
+    "visibility_statute_mi",
+    "wind_dir_deg",
+    "wind_speed_kt"
+]
+
+# How each field is reduced to one value per aggregateWindow
+FIELD_AGGREGATES = {
+    "altim_hpa": "mean",
+    "altim_in_hg": "mean",
+    "dewpoint_c": "mean",
+    "temp_c": "mean",
+    "visibility_statute_mi": "min",
+    "wind_dir_deg": "last",
+    "wind_speed_kt": "max"
+}
+
+WINDOW_SECONDS = 24 * 3600
+# Ask Influx for new rows at most this often (per station)
+REFRESH_SECONDS = 60
+# Stations we keep a window for (least recently used ones are dropped)
+MAX_WINDOWS = int(os.getenv("METAR_HISTORY_MAX_WINDOWS", "16"))
+
+# Limits for get_downsampled() callers (see /api/enzv)
+MAX_RANGE_SECONDS = 90 * 24 * 3600
+DEFAULT_POINTS = 300
+MAX_POINTS = 2000
+
+_DURATION_PATTERN = re.compile(r"^(\d+)([mhd])$")
+_DURATION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+# Downsampled results: how long they're reused, and how many (station, range, every) we keep
+RESULT_TTL_SECONDS = 60
+RESULT_CACHE_SIZE = 64
+
+_query_api = None
+_bucket = None
+_windows = OrderedDict()  # station -> _Window, least recently used first
+_windows_lock = threading.Lock()
+_results = OrderedDict()  # (station, range, every) -> (expires_at, rows)
+_results_lock = threading.Lock()
+
+
+class _Window:
+    def __init__(self):
+        self.rows = deque()     # {"time": iso, <METAR_FIELDS>...}, time-ascending
+        self.last_seen = None   # datetime of rows[-1]
+        self.checked_at = 0.0   # time.monotonic() of the last query
+        self.seeded = False
+        self.refresh_lock = threading.Lock()  # held while querying Influx
+        self.rows_lock = threading.Lock()     # held while rows / last_seen change
+
+
+def configure(query_api, bucket: str):
+    global _query_api, _bucket
+    _query_api = query_api
+    _bucket = bucket
+
+
+def parse_duration(value: str) -> int | None:
+    """
+    Seconds in a "30m" / "6h" / "7d" duration (the subset of Flux durations
+    we accept from clients), or None if it isn't one.
+    """
+    match = _DURATION_PATTERN.match(value or "")
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def _run(flux_query: str) -> list:
+    """
+    Run a query ending in a pivot on _field, as [(datetime, row)] sorted by time.
+    """
+    rows = []
+    for table in _query_api.query(flux_query):
+        for record in table.records:
+            row = {"time": record.get_time().isoformat()}
+            for field in METAR_FIELDS:
+                row[field] = record.values.get(field)
+            rows.append((record.get_time(), row))
+    rows.sort(key=lambda r: r[0])
+    return rows
+
+
+def _query(station: str, start: str) -> list:
+    """
+    Pivoted rows for `station` since `start` (a Flux duration like "-24h",
+    or an RFC3339 time), time-ascending, as [(datetime, row)].
+    """
+    field_filter = " or\n            ".join(f'r["_field"] == "{f}"' for f in METAR_FIELDS)
+    range_start = start if start.startswith("-") else f'time(v: "{start}")'
+    flux_query = f"""
+        from(bucket: "{_bucket}")
+          |> range(start: {range_start})
+          |> filter(fn: (r) => r["_measurement"] == "metar")
+          |> filter(fn: (r) => r["station_id"] == "{station}")
+          |> filter(fn: (r) =>
+            {field_filter}
+          )
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> sort(columns: ["_time"], desc: false)
+        """
+
+    return _run(flux_query)
+
+
+def _refresh(station: str, window: _Window):
+    """
+    Seed or top up `window`. Caller holds window.refresh_lock.
+    """
+    if window.last_seen is not None:
+        new_rows = _query(station, window.last_seen.isoformat())
+    else:
+        new_rows = _query(station, f"-{WINDOW_SECONDS // 3600}h")
+    window.checked_at = time.monotonic()
+
+    with window.rows_lock:
+        for ts, row in new_rows:
+            if window.last_seen is not None and ts < window.last_seen:
+                continue
+            if window.last_seen is not None and ts == window.last_seen:
+                # range(start:) is inclusive, so the last row comes back again, possibly
+                # with fields that were written after we first read it
+                if window.rows:
+                    window.rows[-1] = row
+                continue
+            window.rows.append(row)
+            window.last_seen = ts
+        _trim(window)
+    window.seeded = True
+
+
+def _trim(window: _Window):
+    """
+    Drop rows older than WINDOW_SECONDS. Caller holds window.rows_lock.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=WINDOW_SECONDS)
+    while window.rows and datetime.fromisoformat(window.rows[0]["time"]) < cutoff:
+        window.rows.popleft()
+
+
+def get_rows(station: str) -> list:
+    """
+    The last 24 h of rows for `station`, time-ascending. Hits Influx only to
+    seed the window or when it's older than REFRESH_SECONDS; while another
+    request is already refreshing, the current window is served as-is.
+    Raises whatever the Influx client raises if the window can't be seeded.
+    """
+    with _windows_lock:
+        window = _windows.get(station)
+        if window is None:
+            window = _windows[station] = _Window()
+            # Any valid ICAO can ask (/api/enzv?station=), so keep this bounded
+            while len(_windows) > MAX_WINDOWS:
+                _windows.popitem(last=False)
+        _windows.move_to_end(station)
+
+    if time.monotonic() - window.checked_at >= REFRESH_SECONDS:
+        # Until it's seeded there's nothing to serve, so wait for whoever is seeding it
+        if window.refresh_lock.acquire(blocking=not window.seeded):
+            try:
+                if time.monotonic() - window.checked_at >= REFRESH_SECONDS:
+                    _refresh(station, window)
+            except Exception as e:
+                if not window.seeded:
+                    raise
+                window.checked_at = time.monotonic()
+                print(f"[metar_history] Top-up for {station} failed, serving the last window: {e}")
+            finally:
+                window.refresh_lock.release()
+
+    with window.rows_lock:
+        # Also here, so a window whose top-ups keep failing doesn't serve rows older than 24 h
+        _trim(window)
+        return list(window.rows)
+
+
+def _query_downsampled(station: str, range_str: str, every: str) -> list:
+    base = f"""
+        base = from(bucket: "{_bucket}")
+          |> range(start: -{range_str})
+          |> filter(fn: (r) => r["_measurement"] == "metar")
+          |> filter(fn: (r) => r["station_id"] == "{station}")
+        """
+    streams = []
+    for i, (field, fn) in enumerate(FIELD_AGGREGATES.items()):
+        streams.append(f"""
+        f{i} = base
+          |> filter(fn: (r) => r["_field"] == "{field}")
+          |> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)
+        """)
+    flux_query = base + "".join(streams) + f"""
+        union(tables: [{", ".join(f"f{i}" for i in range(len(streams)))}])
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> sort(columns: ["_time"], desc: false)
+        """
+
+    return [row for _, row in _run(flux_query)]
+
+
+def get_downsampled(station: str, range_str: str, every: str) -> list:
+    """
+    Rows for `station` over the last `range_str` (Flux duration, e.g. "7d"),
+    one per `every` (e.g. "30m"), time-ascending, each field reduced with
+    its FIELD_AGGREGATES function. Cached for RESULT_TTL_SECONDS.
+    Callers validate the arguments; they're pasted into the Flux query.
+    """
+    key = (station, range_str, every)
+    now = time.monotonic()
+    with _results_lock:
+        cached = _results.get(key)
+        if cached and cached[0] > now:
+            _results.move_to_end(key)
+            return cached[1]
+
+    rows = _query_downsampled(station, range_str, every)
+    with _results_lock:
+        _results[key] = (now + RESULT_TTL_SECONDS, rows)
+        _results.move_to_end(key)
+        while len(_results) > RESULT_CACHE_SIZE:
+            _results.popitem(last=False)
+    return rows
@@ -0,0 +1,104 @@
+"""
+metar_poller.py
+
+Background refresher for the METAR board.
+
+Instead of proxying aviationweather.gov on every /api/metars poll, a daemon
+thread fetches the station set on a schedule and keeps the latest payload in
+memory. The route then only reads memory, so upstream load no longer depends
+on how many dashboards are open.
+
+Routine METARs are issued around HH:20/HH:50 (Europe) and HH:51-HH:56 (US),
+and show up on aviationweather.gov a few minutes later, so we poll shortly
+after those times instead of on a fixed interval.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import upstream
+
+METAR_URL = "https://aviationweather.gov/api/data/metar"
+
+METAR_STATIONS = ["KJFK", "KLAX", "ENZV", "ENGM", "KORD", "EGLL", "RJAA", "EKCH", "KMIA", "TNCM"]
+
+# Minutes past the hour to refresh at (a few minutes after the usual issue times)
+METAR_POLL_MINUTES = (0, 25, 55)
+
+# On errors, try again after this many seconds instead of waiting for the next slot
+RETRY_SECONDS = 60
+
+# A payload older than this is flagged as stale (two missed half-hourly issues)
+STALE_AFTER_SECONDS = 65 * 60
+
+_latest = None        # last good payload (list of station dicts)
+_fetched_at = None    # time.time() of the last good fetch
+_state_lock = threading.Lock()
+_poller_thread = None
+
+
+def seconds_until_next_poll(now: datetime) -> float:
+    """
+    Seconds from `now` (UTC) until the next minute in METAR_POLL_MINUTES.
+    """
+    base = now.replace(second=0, microsecond=0)
+    for hour_offset in (0, 1):
+        for minute in METAR_POLL_MINUTES:
+            candidate = base.replace(minute=minute) + timedelta(hours=hour_offset)
+            if candidate > now:
+                return (candidate - now).total_seconds()
+    return 3600.0
+
+
+def refresh_metars():
+    """
+    Fetch the station set once and store it as the latest payload.
+    Raises requests.RequestException if the fetch fails (the old payload is kept).
+    """
+    global _latest, _fetched_at
+    params = {"ids": ",".join(METAR_STATIONS).lower(), "format": "json"}
+    resp = upstream.get("aviationweather", METAR_URL, params=params)
+    resp.raise_for_status()
+    data = resp.json()  # list of dictionaries, one per station
+
+    with _state_lock:
+        _latest = data
+        _fetched_at = time.time()
+    return data
+
+
+def get_latest_metars():
+    """
+    Return (payload, age_seconds) from memory, or (None, None) if we have
+    never fetched successfully.
+    """
+    with _state_lock:
+        if _latest is None:
+            return None, None
+        return _latest, time.time() - _fetched_at
+
+
+def _poll_loop():
+    while True:
+        try:
+            data = refresh_metars()
+            print(f"[metar_poller] Refreshed {len(data)} METARs.")
+            delay = seconds_until_next_poll(datetime.now(timezone.utc))
+        except requests.RequestException as e:
+            print(f"[metar_poller] Refresh failed, keeping last payload: {e}")
+            delay = RETRY_SECONDS
+        time.sleep(delay)
+
+
+def start_metar_poller():
+    """
+    Start the background poller thread (once per process).
+    """
+    global _poller_thread
+    if _poller_thread is not None:
+        return
+    _poller_thread = threading.Thread(target=_poll_loop, name="metar-poller", daemon=True)
+    _poller_thread.start()
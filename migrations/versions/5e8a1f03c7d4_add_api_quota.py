@@ -0,0 +1,31 @@
+"""Add api_quota token bucket table
+
+Revision ID: 5e8a1f03c7d4
+Revises: c41d7e9a2b50
+Create Date: 2026-10-18 11:02:47.730915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a1f03c7d4'
+down_revision = 'c41d7e9a2b50'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('api_quota',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('used', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('api_quota')
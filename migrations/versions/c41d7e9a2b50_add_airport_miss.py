@@ -0,0 +1,34 @@
+"""Add airport_miss negative cache table
+
+Revision ID: c41d7e9a2b50
+Revises: eba5c89ff5df
+Create Date: 2026-10-18 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9a2b50'
+down_revision = 'eba5c89ff5df'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('airport_miss',
+    sa.Column('icao', sa.String(length=10), nullable=False),
+    sa.Column('checked_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('icao')
+    )
+    with op.batch_alter_table('airport_miss', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_airport_miss_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('airport_miss', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_airport_miss_expires_at'))
+
+    op.drop_table('airport_miss')
@@ -0,0 +1,20 @@
+# models/airport_miss.py
+from db import db
+
+class AirportMiss(db.Model):
+    """
+    Negative cache: station codes CheckWX had no data for.
+    Rows are ignored (and overwritten) once expires_at has passed.
+    """
+    __tablename__ = "airport_miss"
+
+    icao = db.Column(db.String(10), primary_key=True)
+    checked_at = db.Column(db.DateTime, nullable=False)  # UTC
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # UTC
+
+    def to_dict(self):
+        return {
+            "icao": self.icao,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
+        }
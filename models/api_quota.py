@@ -0,0 +1,24 @@
+# models/api_quota.py
+from db import db
+
+class ApiQuota(db.Model):
+    """
+    Token bucket state for a rate-limited third-party API (e.g. "checkwx"),
+    shared by all workers and kept across restarts. See checkwx_quota.py.
+    """
+    __tablename__ = "api_quota"
+
+    name = db.Column(db.String(50), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)  # UTC, when `tokens` was last computed
+    day = db.Column(db.Date, nullable=False)  # UTC day `used` counts for
+    used = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "tokens": self.tokens,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "day": self.day.isoformat() if self.day else None,
+            "used": self.used,
+        }
@@ -2,15 +2,38 @@
 """
 preload_cache.py
 
-A small script that queries our local Flask endpoint /api/airport/<icao>
-for a list of airports, forcing them to be cached in airportDb.json.
+Warms the `airport` table straight from CheckWX, without going through the
+web app's /api/airport/<icao> endpoint:
+
+  1) dedupes the input (TOP_AIRPORTS below, or ICAO files given on the
+     command line) and drops codes that can't be ICAO identifiers,
+  2) skips codes already in the table or in the negative cache,
+  3) fetches the rest in multi-station batches (CHECKWX_BATCH_SIZE codes per
+     request), PRELOAD_WORKERS requests at a time, paid from the background
+     CheckWX budget so dashboard lookups keep their reserve,
+  4) bulk-inserts each batch (ON CONFLICT DO NOTHING) and checkpoints the
+     codes it has handled, so an interrupted run picks up where it stopped.
 
 Usage:
-  python preload_cache.py
+  python preload_cache.py                  # TOP_AIRPORTS
+  python preload_cache.py icaos.txt ...    # codes from files (whitespace/comma separated)
 """
 
-import requests
-import time
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from db import db, insert_ignore_existing, create_cli_app
+from models.airport import Airport
+from routes.airport_routes import normalize_icao_list, airport_from_station
+from checkwx_scheduler import fetch_batch, CHECKWX_BATCH_SIZE
+from checkwx_quota import QuotaExhausted, BACKGROUND
+import airport_misses
+
+# Just the DB and the models, not the web app (no Influx, pollers or cache warm-up)
+app = create_cli_app(__name__)
 
 # 1) Define your top airports here. (Example: 10 for demo; you could have 1000.)
 TOP_AIRPORTS = [
@@ -107,38 +130,115 @@ TOP_AIRPORTS = [
     # if you only do it once or very infrequently.
 ]
 
-# 2) The base URL of your local Flask app
-BASE_URL = "https://home.chulak.io"
+# 2) How many CheckWX requests to have in flight at once
+PRELOAD_WORKERS = 4
 
-def main():
-    total_airports = len(TOP_AIRPORTS)
-    print(f"Preloading airport cache for {total_airports} airports...")
+# 3) Progress file, so an interrupted run can resume
+CHECKPOINT_PATH = Path(__file__).resolve().parent / "data" / "preload_checkpoint.json"
+
+
+def load_checkpoint() -> set:
+    if not CHECKPOINT_PATH.exists():
+        return set()
+    try:
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            return set(json.load(f).get("done", []))
+    except (OSError, ValueError) as e:
+        print(f"[preload] Ignoring unreadable checkpoint: {e}")
+        return set()
 
-    for i, icao in enumerate(TOP_AIRPORTS, start=1):
-        icao = icao.strip().upper()
-        url = f"{BASE_URL}/api/airport/{icao}"
-        print(f"[{i}/{total_airports}] GET {url}")
 
-        try:
-            resp = requests.get(url, timeout=10)
-        except requests.RequestException as e:
-            print(f"  => ERROR: Request failed for {icao}: {e}")
-            continue
+def save_checkpoint(done: set):
+    CHECKPOINT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CHECKPOINT_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"done": sorted(done)}, f)
+    os.replace(tmp, CHECKPOINT_PATH)
 
-        if resp.status_code == 200:
-            data = resp.json()
-            # We have the full station record now
-            print(f"  => OK: Stored {icao} with data keys {list(data.keys())}")
-        else:
-            # Possibly 404 or something else
-            print(f"  => ERROR: {icao} returned {resp.status_code} - {resp.text}")
 
-        # OPTIONAL: a small sleep to avoid spamming. Usually not needed if your local app
-        # is robust, but if CheckWX has rate-limits, the local app might queue them quickly.
-        # time.sleep(0.3)
+def read_icao_files(paths) -> list:
+    codes = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            codes.extend(f.read().replace(",", " ").split())
+    return codes
 
-    print("Done preloading cache!")
+
+def fetch_in_app_context(batch: list) -> dict:
+    # Pool threads need their own app context to reach the shared quota bucket
+    with app.app_context():
+        return fetch_batch(batch, BACKGROUND)
+
+
+def main():
+    codes = read_icao_files(sys.argv[1:]) if len(sys.argv) > 1 else TOP_AIRPORTS
+    icaos = [icao for icao in normalize_icao_list(codes) if airport_misses.is_valid_icao(icao)]
+    print(f"[preload] {len(codes)} codes in, {len(icaos)} unique valid ICAOs.")
+
+    done = load_checkpoint()
+    if done:
+        print(f"[preload] Resuming, {len(done)} codes already handled.")
+    todo = [icao for icao in icaos if icao not in done]
+
+    # Skip what we already have (or know doesn't exist), in chunks to keep the IN lists sane
+    known = set()
+    for i in range(0, len(todo), 500):
+        chunk = todo[i:i + 500]
+        known.update(r[0] for r in db.session.query(Airport.icao).filter(Airport.icao.in_(chunk)))
+        known.update(airport_misses.known_misses(chunk))
+    todo = [icao for icao in todo if icao not in known]
+    print(f"[preload] {len(known)} already cached, {len(todo)} to fetch.")
+
+    batches = [todo[i:i + CHECKWX_BATCH_SIZE] for i in range(0, len(todo), CHECKWX_BATCH_SIZE)]
+    columns = [c.name for c in Airport.__table__.columns]
+    stored = missing = failed = not_attempted = 0
+
+    with ThreadPoolExecutor(max_workers=PRELOAD_WORKERS) as pool:
+        futures = {pool.submit(fetch_in_app_context, batch): batch for batch in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            if fut.cancelled():
+                # Never sent (we stopped early); not a CheckWX failure
+                not_attempted += len(batch)
+                continue
+            try:
+                found = fut.result()
+            except QuotaExhausted as e:
+                print(f"[preload] {e}; stopping, rerun later to resume.")
+                not_attempted += len(batch)
+                for other in futures:
+                    other.cancel()
+                continue
+            except Exception as e:
+                print(f"[preload] Batch {batch[0]}..{batch[-1]} failed, will retry next run: {e}")
+                failed += len(batch)
+                continue
+
+            rows = []
+            for icao, station in found.items():
+                if station:
+                    ap = airport_from_station(icao, station)
+                    rows.append({col: getattr(ap, col) for col in columns})
+                else:
+                    airport_misses.record_miss(icao)
+                    missing += 1
+            insert_ignore_existing(Airport, rows)
+            db.session.commit()
+            stored += len(rows)
+
+            done.update(batch)
+            save_checkpoint(done)
+            print(f"[preload] {stored} stored, {missing} unknown, {len(done)}/{len(icaos)} handled")
+
+    if failed or not_attempted:
+        print(f"[preload] {failed} codes failed, {not_attempted} not attempted; both are retried next run.")
+    if all(icao in done or icao in known for icao in icaos):
+        CHECKPOINT_PATH.unlink(missing_ok=True)
+        print("Done preloading cache!")
+    else:
+        print("Preload incomplete; rerun to resume from the checkpoint.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with app.app_context():
+        main()
@@ -0,0 +1,144 @@
+"""
+price_store.py
+
+Day-price store for hvakosterstrommen.no.
+
+A published price file for a given (date, region) never changes, so once we
+have it we keep it forever:
+  1) in memory (dict keyed by (date, region)),
+  2) on disk under data/prices/<region>/<YYYY-MM-DD>.json, so restarts
+     and other workers don't have to go upstream again.
+
+Days that are not published yet (typically "tomorrow" before ~13:00) are
+remembered for a short negative TTL, so we don't hit upstream on every poll.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date
+from pathlib import Path
+
+import upstream
+
+PRICES_URL = "https://www.hvakosterstrommen.no/api/v1/prices/{year}/{month:02d}-{day:02d}_{region}.json"
+
+# Price areas published by hvakosterstrommen.no
+PRICE_REGIONS = {"NO1", "NO2", "NO3", "NO4", "NO5"}
+
+PRICE_DIR = Path(__file__).resolve().parent / "data" / "prices"
+
+# How long to remember "not published yet" before asking upstream again
+NOT_PUBLISHED_TTL_SECONDS = 10 * 60
+
+# (date_iso, region) -> list of price entries
+_prices = {}
+# (date_iso, region) -> monotonic time when we may ask upstream again
+_not_published = {}
+_store_lock = threading.Lock()
+
+# Used by get_many_day_prices() to fetch days/regions in parallel
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="price-store")
+
+
+def _disk_path(day_iso: str, region: str) -> Path:
+    return PRICE_DIR / region / f"{day_iso}.json"
+
+
+def _load_from_disk(day_iso: str, region: str):
+    path = _disk_path(day_iso, region)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[price_store] Error reading {path}, ignoring: {e}")
+        return None
+
+
+def _save_to_disk(day_iso: str, region: str, data):
+    path = _disk_path(day_iso, region)
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Own tmp file per writer: another thread/worker may be saving the same day
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent,
+                                         prefix=f"{day_iso}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            json.dump(data, f)
+        os.replace(tmp_path, path)  # atomic, readers never see half a file
+    except Exception as e:
+        print(f"[price_store] Error writing {path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_day_prices(day: date, region: str):
+    """
+    Return the list of hourly price entries for (day, region).
+
+    Returns None if upstream says the day isn't published (404 or empty),
+    and remembers that for NOT_PUBLISHED_TTL_SECONDS.
+    Raises ValueError for an unknown region,
+    and requests.RequestException on network / server errors.
+    """
+    region = region.strip().upper()
+    if region not in PRICE_REGIONS:
+        raise ValueError(f"Unknown price region {region}")
+    key = (day.isoformat(), region)
+
+    with _store_lock:
+        if key in _prices:
+            return _prices[key]
+        retry_at = _not_published.get(key)
+        if retry_at is not None and time.monotonic() < retry_at:
+            return None
+
+    data = _load_from_disk(*key)
+    if data is None:
+        url = PRICES_URL.format(year=day.year, month=day.month, day=day.day, region=region)
+        resp = upstream.get("hvakosterstrommen", url)
+        if resp.status_code == 404:
+            data = None
+        else:
+            resp.raise_for_status()
+            data = resp.json() or None
+
+        if data is None:
+            with _store_lock:
+                _not_published[key] = time.monotonic() + NOT_PUBLISHED_TTL_SECONDS
+            return None
+        _save_to_disk(*key, data)
+
+    with _store_lock:
+        _prices[key] = data
+        _not_published.pop(key, None)
+    return data
+
+
+def get_many_day_prices(keys, deadline_seconds: float) -> dict:
+    """
+    Fetch several (day, region) pairs concurrently with get_day_prices().
+
+    Waits until all are done or `deadline_seconds` has passed, whichever
+    comes first, and returns {(day, region): result} where result is the
+    price list, None (not published), or the exception raised (including
+    TimeoutError for fetches that missed the deadline; those keep running
+    and still land in the store for the next call).
+    """
+    futures = {key: _executor.submit(get_day_prices, *key) for key in keys}
+    wait(futures.values(), timeout=deadline_seconds)
+
+    results = {}
+    for key, fut in futures.items():
+        if not fut.done():
+            results[key] = TimeoutError(f"No answer within {deadline_seconds}s")
+        elif fut.exception() is not None:
+            results[key] = fut.exception()
+        else:
+            results[key] = fut.result()
+    return results
@@ -48,7 +48,8 @@ function smoothTableUpdate(tbodyElem, rowHtmlArray) {
 // ==========================
 async function fetchCurrentWeather() {
   try {
-    const res = await fetch('/api/weather');
+    // Only what the current-conditions card and 12h table use (see /api/weather projection)
+    const res = await fetch('/api/weather?hours=12&fields=air_temperature,wind_speed,wind_from_direction,precipitation_amount');
     const data = await res.json();
 
     setSymbolImage('symbol-1h', data.symbol_1h);
@@ -107,24 +108,15 @@ async function setSymbolImage(imgId, symbolCode, dateStr) {
       .replace('_night', '')
       .replace('_polartwilight', '');
 
-  // 1) Fetch sunrise/sunset data
+  // 1) Sunrise/sunset for the day (from the shared sun table, see getSunDay)
   //    (If dateStr is missing, you might default to today's date.)
-  const today = dateStr || new Date().toISOString().slice(0, 10);
-  let sunData;
-  try {
-    const res = await fetch(`/api/sun?date=${today}`);
-    sunData = await res.json();
-  } catch (err) {
-    console.error("Error fetching /api/sun data:", err);
-    // Fallback to base icon if fetch fails
-    imgElem.src = `images/weathericons/svg/${base}.svg`;
-    return;
-  }
+  const today = dateStr || toIsoDateString(new Date());
+  const sunDay = await getSunDay(today);
 
-  // 2) Extract sunrise/sunset from sunData
-  //    Check for validity in case "No local data" was returned
-  const sunriseStr = sunData?.properties?.sunrise?.time;
-  const sunsetStr  = sunData?.properties?.sunset?.time;
+  // 2) Extract sunrise/sunset
+  //    Check for validity in case there's no local data for the day
+  const sunriseStr = sunDay?.sunrise;
+  const sunsetStr  = sunDay?.sunset;
   if (!sunriseStr || !sunsetStr) {
     // No sunrise/sunset data found, just default to base
     imgElem.src = `images/weathericons/svg/${base}.svg`;
@@ -201,16 +193,87 @@ function buildForecastTable(timeseries) {
 // ==========================
 let todayDaylightMinutes = null;
 
+// "YYYY-MM-DD" -> { sunrise, sunset } (ISO strings), filled by /api/sun range requests
+const sunDays = new Map();
+let sunRangeRequest = null;
+
+/**
+ * Load every day the dashboard needs (a week back, a week ahead and the
+ * next/last Dec 21) with one /api/sun?from=&to= request.
+ */
+function loadSunDays() {
+  if (!sunRangeRequest) {
+    const { from, to } = sunDateRange();
+    sunRangeRequest = fetch(`/api/sun?from=${from}&to=${to}`)
+        .then(res => res.json())
+        .then(data => {
+          for (const f of data.features || []) {
+            sunDays.set(f.properties.date, {
+              sunrise: f.properties.sunrise?.time,
+              sunset: f.properties.sunset?.time
+            });
+          }
+        })
+        .catch(err => {
+          console.error('Error fetching /api/sun range:', err);
+          sunRangeRequest = null;  // try again next time
+        });
+  }
+  return sunRangeRequest;
+}
+
+async function getSunDay(dateStr) {
+  await loadSunDays();
+  if (!sunDays.has(dateStr)) {
+    // Outside the preloaded range (or the day rolled over), fetch just that day
+    try {
+      const res = await fetch(`/api/sun?date=${dateStr}`);
+      const data = await res.json();
+      if (data.type !== 'Feature') return null;
+      sunDays.set(dateStr, {
+        sunrise: data.properties?.sunrise?.time,
+        sunset: data.properties?.sunset?.time
+      });
+    } catch (err) {
+      console.error('Error fetch sunrise for', dateStr, err);
+      return null;
+    }
+  }
+  return sunDays.get(dateStr);
+}
+
+function sunCompareDates() {
+  const now = new Date();
+  const oneWeekAgo = new Date();
+  oneWeekAgo.setDate(oneWeekAgo.getDate() - 7);
+  const inOneWeek = new Date();
+  inOneWeek.setDate(inOneWeek.getDate() + 7);
+
+  let dec21Year = now.getFullYear();
+  if (now.getMonth() === 0) dec21Year -= 1;
+
+  return {
+    today: toIsoDateString(now),
+    weekAgo: toIsoDateString(oneWeekAgo),
+    inWeek: toIsoDateString(inOneWeek),
+    dec21: `${dec21Year}-12-21`
+  };
+}
+
+function sunDateRange() {
+  const dates = Object.values(sunCompareDates()).sort();
+  return { from: dates[0], to: dates[dates.length - 1] };
+}
+
 async function fetchSunTimes() {
   try {
-    const res = await fetch('/api/sun');
-    const data = await res.json();
-    if (data.type !== 'Feature') {
-      console.error('Sun data not Feature:', data);
+    const day = await getSunDay(toIsoDateString(new Date()));
+    const srISO = day?.sunrise;
+    const ssISO = day?.sunset;
+    if (!srISO || !ssISO) {
+      console.error('No sun data for today');
       return;
     }
-    const srISO = data.properties?.sunrise?.time;
-    const ssISO = data.properties?.sunset?.time;
 
     if (srISO) {
       const srDate = new Date(srISO);
@@ -257,20 +320,12 @@ async function compareSunTimes() {
   if (todayDaylightMinutes === null) {
     await fetchSunTimes();
   }
-  const oneWeekAgo = new Date();
-  oneWeekAgo.setDate(oneWeekAgo.getDate() - 7);
-  const inOneWeek = new Date();
-  inOneWeek.setDate(inOneWeek.getDate() + 7);
-
-  const now = new Date();
-  let dec21Year = now.getFullYear();
-  if (now.getMonth() === 0) dec21Year -= 1;
-  const dec21Str = `${dec21Year}-12-21`;
+  const dates = sunCompareDates();
 
   const [weekAgoData, inOneWeekData, dec21Data] = await Promise.all([
-    fetchSunriseForDate(toIsoDateString(oneWeekAgo)),
-    fetchSunriseForDate(toIsoDateString(inOneWeek)),
-    fetchSunriseForDate(dec21Str)
+    fetchSunriseForDate(dates.weekAgo),
+    fetchSunriseForDate(dates.inWeek),
+    fetchSunriseForDate(dates.dec21)
   ]);
 
   const weekAgoMins = weekAgoData?.minutes ?? 0;
@@ -296,18 +351,9 @@ async function compareSunTimes() {
 }
 
 async function fetchSunriseForDate(dateStr) {
-  try {
-    const resp = await fetch(`/api/sun?date=${dateStr}`);
-    const data = await resp.json();
-    if (data.type !== 'Feature') return null;
-    const srISO = data.properties?.sunrise?.time;
-    const ssISO = data.properties?.sunset?.time;
-    const mins = getDaylightDurationMinutes(srISO, ssISO);
-    return { minutes: mins };
-  } catch (err) {
-    console.error('Error fetch sunrise for', dateStr, err);
-    return null;
-  }
+  const day = await getSunDay(dateStr);
+  if (!day) return null;
+  return { minutes: getDaylightDurationMinutes(day.sunrise, day.sunset) };
 }
 function toIsoDateString(d) {
   const y = d.getFullYear();
@@ -680,190 +726,11 @@ function classifyFlightRules(m) {
 }
 
 // =========== 8) VATSIM Section with 4 tables ===========
+// The VATSIM feed is fetched and aggregated server-side (/api/vatsim/summary),
+// so we only download a few KB here instead of the whole feed.
 
-// 8A) Distances for "on ground" check
-function distanceNm(lat1, lon1, lat2, lon2) {
-  const R = 6371; // Earth radius in km
-  const toRad = Math.PI / 180;
-  const dLat = (lat2 - lat1) * toRad;
-  const dLon = (lon2 - lon1) * toRad;
-  const a = Math.sin(dLat/2)**2 +
-      Math.cos(lat1*toRad)*Math.cos(lat2*toRad)*
-      Math.sin(dLon/2)**2;
-  const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
-  const distKm = R * c;
-  return distKm / 1.852; // nm
-}
-function isOnGround(pilot, airport) {
-  if (!pilot.latitude || !pilot.longitude) return false;
-  const dist = distanceNm(airport.lat, airport.lon, pilot.latitude, pilot.longitude);
-  if (dist > 5) return false; // outside 5 nm
-  if (pilot.groundspeed && pilot.groundspeed < 50) return true;
-  if (pilot.altitude && pilot.altitude < 2000) return true;
-  return false;
-}
-
-// 8B) Aircraft families
-const aircraftFamilyMap = {
-  // ========== AIRBUS ==========
-  "A318": "Airbus A320",
-  "A319": "Airbus A320",
-  "A320": "Airbus A320",
-  "A321": "Airbus A320",
-  "A20N": "Airbus A320neo",
-  "A21N": "Airbus A320neo",
-
-  "A330": "Airbus A330",
-  "A332": "Airbus A330",
-  "A333": "Airbus A330",
-  "A338": "Airbus A330neo",
-  "A339": "Airbus A330neo",
-
-  "A340": "Airbus A340",
-  "A342": "Airbus A340",
-  "A343": "Airbus A340",
-  "A345": "Airbus A340",
-  "A346": "Airbus A340",
-
-  "A350": "Airbus A350",
-  "A359": "Airbus A350",
-  "A35K": "Airbus A350",
-
-  "A380": "Airbus A380",
-
-  // ========== BOEING ==========
-  "B707": "Boeing 707",
-  "B717": "Boeing 717",
-  "B727": "Boeing 727",
-
-  "B737": "Boeing 737",
-  "B731": "Boeing 737",
-  "B732": "Boeing 737",
-  "B733": "Boeing 737",
-  "B734": "Boeing 737",
-  "B735": "Boeing 737",
-  "B736": "Boeing 737",
-  "B737": "Boeing 737",
-  "B738": "Boeing 737",
-  "B739": "Boeing 737",
-  "B37M": "Boeing 737 MAX",
-  "B38M": "Boeing 737 MAX",
-  "B39M": "Boeing 737 MAX",
-
-  "B747": "Boeing 747",
-  "B741": "Boeing 747",
-  "B742": "Boeing 747",
-  "B743": "Boeing 747",
-  "B744": "Boeing 747",
-  "B748": "Boeing 747",
-
-  "B757": "Boeing 757",
-  "B752": "Boeing 757",
-  "B753": "Boeing 757",
-
-  "B767": "Boeing 767",
-  "B762": "Boeing 767",
-  "B763": "Boeing 767",
-  "B764": "Boeing 767",
-
-  "B777": "Boeing 777",
-  "B772": "Boeing 777",
-  "B773": "Boeing 777",
-  "B77L": "Boeing 777",
-  "B77W": "Boeing 777",
-
-  "B787": "Boeing 787",
-  "B788": "Boeing 787",
-  "B789": "Boeing 787",
-  "B78X": "Boeing 787",
-
-  // ========== EMBRAER ==========
-  "E170": "Embraer E-Jet",
-  "E175": "Embraer E-Jet",
-  "E190": "Embraer E-Jet",
-  "E195": "Embraer E-Jet",
-  "E290": "Embraer E2",
-  "E295": "Embraer E2",
-
-  // ========== BOMBARDIER ==========
-  "CRJ": "Bombardier CRJ",
-  "CRJ1": "Bombardier CRJ",
-  "CRJ2": "Bombardier CRJ",
-  "CRJ7": "Bombardier CRJ",
-  "CRJ9": "Bombardier CRJ",
-  "CRJX": "Bombardier CRJ",
-
-  "DH8A": "Bombardier Dash 8",
-  "DH8B": "Bombardier Dash 8",
-  "DH8C": "Bombardier Dash 8",
-  "DH8D": "Bombardier Dash 8",
-
-  // ========== ATR ==========
-  "AT42": "ATR 42",
-  "AT43": "ATR 42",
-  "AT45": "ATR 42",
-  "AT46": "ATR 42",
-  "AT72": "ATR 72",
-
-  // ========== MISC ==========
-  "CONC": "Concorde",
-  "C130": "Lockheed C-130",
-  "L101": "Lockheed L-1011 Tristar",
-  "MD11": "McDonnell Douglas MD-11",
-  "MD80": "McDonnell Douglas MD-80",
-  "MD81": "McDonnell Douglas MD-80",
-  "MD82": "McDonnell Douglas MD-80",
-  "MD83": "McDonnell Douglas MD-80",
-  "MD87": "McDonnell Douglas MD-80",
-  "MD88": "McDonnell Douglas MD-80",
-  "MD90": "McDonnell Douglas MD-80",
-
-  // ========== COMAC ==========
-  "C919": "COMAC C919",
-  "ARJ2": "COMAC ARJ21"
-};
-
-function getAircraftFamily(acftShort) {
-  if (!acftShort || acftShort.length < 3) return acftShort || "Unknown";
-
-  const code = acftShort.toUpperCase();
-
-  // First, check for an exact ICAO match
-  if (aircraftFamilyMap[code]) return aircraftFamilyMap[code];
-
-  // If not found, check based on the first 3 letters
-  const prefix = code.substring(0, 3);
-  return aircraftFamilyMap[prefix] || prefix;
-}
-
-// 8C) Tracked "Favorite" airports
-const trackedAirports = [
-  { icao: "ENGM", name: "Oslo Gardermoen",    lat: 60.202,  lon: 11.083 },
-  { icao: "ENZV", name: "Stavanger Sola",     lat: 58.8765, lon: 5.637 },
-  { icao: "KJFK", name: "New York JFK",       lat: 40.6398, lon: -73.7789 },
-  { icao: "KEWR", name: "Newark Liberty EWR", lat: 40.6925, lon: -74.1687 },
-  { icao: "KLGA", name: "New York LaGuardia", lat: 40.7772, lon: -73.8726 },
-  { icao: "KPHL", name: "Philadelphia PHL",   lat: 39.8719, lon: -75.2411 },
-  { icao: "KLAX", name: "Los Angeles LAX",    lat: 33.9425, lon: -118.4081 }
-];
-
-const VATSIM_DATA_URL = 'https://data.vatsim.net/v3/vatsim-data.json';
 const MY_VATSIM_CID = 908962;
 
-/***************************************************
- * FIXED + IMPROVED fetchVatsimStats()
- * ------------------------------------
- * 1) We still do an initial pass to build airportStats
- *    for all airports (departures+arrivals).
- * 2) We sort + pick top-5 by departures.
- * 3) We fetch lat/lon for each top-5 airport
- *    by calling /api/airport/<icao>.
- * 4) We do a second pass over all pilots to see
- *    if they are on the ground at each top-5 airport
- *    (using the newly fetched coordinates).
- * 5) Everything else remains the same as your original,
- *    including how we handle "favorite airports."
- ***************************************************/
 async function fetchVatsimStats() {
   const myCard = document.getElementById('my-vatsim-card');
   const myCallsignEl = document.getElementById('my-callsign');
@@ -886,198 +753,60 @@ async function fetchVatsimStats() {
   }
 
   try {
-    // 1) Fetch raw VATSIM data
-    const resp = await fetch(VATSIM_DATA_URL);
+    // 1) Fetch the aggregated summary (+ my pilot)
+    const resp = await fetch(`/api/vatsim/summary?cid=${MY_VATSIM_CID}`);
     if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
-    const data = await resp.json();
+    const summary = await resp.json();
     console.log(`[VATSIM Stats] Updated at ${new Date().toLocaleTimeString()}`);
 
-    // 2) Extract global stats
-    const totalClients = data.general.connected_clients || 0;
-    const totalPilots = data.pilots?.length || 0;
-    const totalAtc = data.controllers?.length || 0;
-
-    // Update VATSIM Summary Stats
-    smoothTextUpdate(totalClientsEl, totalClients);
-    smoothTextUpdate(totalPilotsEl, totalPilots);
-    smoothTextUpdate(totalAtcEl, totalAtc);
-
-    // -------------------------------------------------
-    // 3) Build airportStats for ALL airports
-    //    (departures, arrivals; onGround set to 0 initially)
-    // -------------------------------------------------
-    const airportStats = {};
-    data.pilots.forEach(pilot => {
-      const dep = pilot.flight_plan?.departure?.toUpperCase().trim();
-      const arr = pilot.flight_plan?.arrival?.toUpperCase().trim();
-
-      if (dep) {
-        if (!airportStats[dep]) {
-          airportStats[dep] = { departures: 0, arrivals: 0, onGround: 0 };
-        }
-        airportStats[dep].departures++;
-      }
-      if (arr) {
-        if (!airportStats[arr]) {
-          airportStats[arr] = { departures: 0, arrivals: 0, onGround: 0 };
-        }
-        airportStats[arr].arrivals++;
-      }
-      // We'll compute onGround in a second pass, below.
-    });
-
-    // -------------------------------------------------
-    // 4) Determine the top-6 airports by departures
-    // -------------------------------------------------
-    const sortedApts = Object.entries(airportStats)
-      .sort((a, b) => b[1].departures - a[1].departures)
-      .slice(0, 6);
-
-    // -------------------------------------------------
-    // 5) Fetch coordinates for each top-6 airport (async)
-    //    Using your /api/airport/<icao> endpoint.
-    // -------------------------------------------------
-    const airportCoords = {}; // Will map ICAO -> { lat, lon }
-    for (const [icao] of sortedApts) {
-      try {
-        const coordResp = await fetch(`/api/airport/${icao}`);
-        if (!coordResp.ok) throw new Error(`Coord fetch ${coordResp.status}`);
-        const coordData = await coordResp.json();
-
-        // We expect something like { lat: 60.xxxx, lon: 11.xxxx }
-        // If it doesn't have lat/lon, skip it
-        if (coordData?.lat != null && coordData?.lon != null) {
-          airportCoords[icao] = {
-            lat: coordData.lat,
-            lon: coordData.lon,
-          };
-        }
-      } catch (err) {
-        console.warn(`Failed to fetch coords for ${icao}:`, err);
-      }
-    }
+    // 2) Global stats
+    smoothTextUpdate(totalClientsEl, summary.totals.clients || 0);
+    smoothTextUpdate(totalPilotsEl, summary.totals.pilots || 0);
+    smoothTextUpdate(totalAtcEl, summary.totals.atc || 0);
 
-    // -------------------------------------------------
-    // 6) Second pass: count onGround for top-5 airports
-    //    using the newly fetched coords, if available.
-    // -------------------------------------------------
-    data.pilots.forEach(pilot => {
-      for (const [icao] of sortedApts) {
-        // If we have lat/lon for this airport, do isOnGround check
-        const coords = airportCoords[icao];
-        if (coords && isOnGround(pilot, coords)) {
-          airportStats[icao].onGround++;
-        }
-      }
-    });
-
-    // -------------------------------------------------
-    // 7) Update UI for the Top-5 Airports
-    // -------------------------------------------------
-    airportsListEl.innerHTML = sortedApts.length
-      ? sortedApts.map(([icao, stats]) => `
+    // 3) Top airports by departures
+    airportsListEl.innerHTML = summary.top_airports.length
+      ? summary.top_airports.map(a => `
           <div class="airport-bubble">
-            <strong>${icao}</strong>
+            <strong>${a.icao}</strong>
             <span>
-              D: ${stats.departures || 0}
-              | A: ${stats.arrivals || 0}
-              | G: ${stats.onGround || 0}
+              D: ${a.departures || 0}
+              | A: ${a.arrivals || 0}
+              | G: ${a.on_ground || 0}
             </span>
           </div>
         `).join("")
       : `<div class="loading-text">No data available</div>`;
 
-    // -------------------------------------------------
-    // 8) Process Most Popular Aircraft (same as before)
-    // -------------------------------------------------
-    const acftMap = {};
-    data.pilots.forEach(p => {
-      const short = p.flight_plan?.aircraft_short;
-      if (!short) return;
-      const fam = getAircraftFamily(short);
-      acftMap[fam] = (acftMap[fam] || 0) + 1;
-    });
-    const sortedAcft = Object.entries(acftMap)
-      .sort((a, b) => b[1] - a[1])
-      .slice(0, 5);
-
-    aircraftListEl.innerHTML = sortedAcft.length
-      ? sortedAcft.map(([fam, count]) => `
+    // 4) Most popular aircraft
+    aircraftListEl.innerHTML = summary.aircraft.length
+      ? summary.aircraft.map(a => `
           <div class="aircraft-bubble">
-            <strong>${fam}</strong>
-            <span>${count} Flights</span>
+            <strong>${a.family}</strong>
+            <span>${a.count} Flights</span>
           </div>
         `).join("")
       : `<div class="loading-text">No data available</div>`;
 
-    // -------------------------------------------------
-    // 9) Process Favorite Airports (unchanged)
-    // -------------------------------------------------
-    const statsFav = {};
-    trackedAirports.forEach(a => {
-      statsFav[a.icao] = { icao: a.icao, name: a.name, departures: 0, arrivals: 0, onGround: 0 };
-    });
-
-    data.pilots.forEach(pilot => {
-      const dep = pilot.flight_plan?.departure?.toUpperCase().trim() || "";
-      const arr = pilot.flight_plan?.arrival?.toUpperCase().trim() || "";
-      if (statsFav[dep]) statsFav[dep].departures++;
-      if (statsFav[arr]) statsFav[arr].arrivals++;
-      trackedAirports.forEach(apt => {
-        if (isOnGround(pilot, apt)) {
-          statsFav[apt.icao].onGround++;
-        }
-      });
-    });
-
-    favoriteAirportsEl.innerHTML = trackedAirports.length
-      ? trackedAirports.map(a => {
-          const s = statsFav[a.icao];
-          return `
+    // 5) Favorite airports
+    favoriteAirportsEl.innerHTML = summary.favorites.length
+      ? summary.favorites.map(s => `
             <div class="airport-bubble">
               <strong>${s.icao}</strong>
-              <span>${s.departures} / ${s.arrivals} (${s.onGround})</span>
-            </div>`;
-        }).join("")
+              <span>${s.departures} / ${s.arrivals} (${s.on_ground})</span>
+            </div>`).join("")
       : `<div class="loading-text">No data available</div>`;
 
-    // -------------------------------------------------
-    // 10) Fetch My Personal VATSIM Data (unchanged)
-    // -------------------------------------------------
-    let myPilot = data.pilots.find(p => p.cid === MY_VATSIM_CID);
-    let myStatus = "OFFLINE"; // default
-
-    if (myPilot) {
-      myStatus = "ONLINE";
-    } else {
-      // If not found in pilots, check prefiles
-      const myPrefile = data.prefiles?.find(p => p.cid === MY_VATSIM_CID);
-      if (myPrefile) {
-        // Construct a "pilot-like" object so our existing logic works
-        myPilot = {
-          cid: myPrefile.cid,
-          callsign: myPrefile.callsign,
-          flight_plan: myPrefile.flight_plan || {},
-          // Prefile has no altitude/lat/lon, so set them to 0 or null
-          latitude: null,
-          longitude: null,
-          altitude: 0,
-          groundspeed: 0,
-          vertical_speed: 0,
-          heading: 0
-        };
-        myStatus = "PREFILED";
-      }
-    }
-
+    // 6) My Personal VATSIM Data (ONLINE / PREFILED / OFFLINE)
+    const myPilot = summary.pilot;
     if (!myPilot) {
       // Not in pilots or prefiles
       myCard.style.display = 'none';
-    } else {
-      myCard.style.display = 'block';
-      myPilot.myStatus = myStatus; // store status on the pilot object
-      updateVatsimTracker(myPilot);
+      return;
     }
+    myCard.style.display = 'block';
+    myPilot.myStatus = summary.pilot_status; // store status on the pilot object
+    updateVatsimTracker(myPilot);
 
     // Distance & ETE
     if (myPilot.flight_plan?.arrival !== '--' && myPilot.latitude && myPilot.longitude) {
@@ -1086,15 +815,14 @@ async function fetchVatsimStats() {
       const pilotLat = myPilot.latitude;
       const pilotLon = myPilot.longitude;
 
-      const arrDistancePromise = fetch(`/api/distance?icao=${arrKey}&lat=${pilotLat}&lon=${pilotLon}`)
-        .then(r => r.json());
-      const depDistancePromise = fetch(`/api/distance?icao=${depKey}&lat=${pilotLat}&lon=${pilotLon}`)
-        .then(r => r.json());
-
-      Promise.all([arrDistancePromise, depDistancePromise])
-        .then(([arrDistData, depDistData]) => {
-          if (arrDistData.error || depDistData.error) {
-            console.warn('Distance error:', arrDistData.error || depDistData.error);
+      // Departure + arrival distances in one request
+      fetch(`/api/distance?icao=${depKey},${arrKey}&lat=${pilotLat}&lon=${pilotLon}`)
+        .then(r => r.json())
+        .then(distData => {
+          const depDistData = distData.distances?.[depKey];
+          const arrDistData = distData.distances?.[arrKey];
+          if (distData.error || !depDistData || !arrDistData) {
+            console.warn('Distance error:', distData.error || distData.missing);
             return;
           }
           myPilot.distance_from_dep = depDistData.distanceNm;
@@ -1,16 +1,76 @@
 # routes/airport_routes.py
 import json
-import requests
+import threading
+from concurrent.futures import Future
+
 from flask import Blueprint, jsonify, request
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from db import db
 from models.airport import Airport
 from dotenv import load_dotenv
 import os
+import upstream
+import coord_cache
+import airport_misses
+import checkwx_quota
+from checkwx_quota import INTERACTIVE
+from checkwx_scheduler import lookup_stations, CHECKWX_BATCH_SIZE
+from airport_index import nearest_airports
 
 airport_bp = Blueprint('airport_bp', __name__)
 load_dotenv()
 CHECKWX_API_KEY = os.getenv("CHECKWX_API_KEY")
 
+# ICAO -> Future of the CheckWX lookup currently in progress (single-flight)
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Upper bound on codes per batch lookup request
+MAX_BATCH_ICAOS = 200
+# Upper bound on k for /nearest
+MAX_NEAREST_K = 100
+
+@airport_bp.route("/nearest", methods=["GET"])
+def nearest_airport():
+    """
+    GET /api/airport/nearest?lat=58.9&lon=5.6&k=5&radius_nm=50
+    The k nearest airports we know (from the in-memory spatial index), closest first.
+    """
+    lat = request.args.get("lat", None, float)
+    lon = request.args.get("lon", None, float)
+    k = request.args.get("k", 5, int)
+    radius_nm = request.args.get("radius_nm", None, float)
+
+    if lat is None or lon is None or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        return jsonify({"error": "Missing or invalid lat/lon"}), 400
+    if not (1 <= k <= MAX_NEAREST_K):
+        return jsonify({"error": f"k must be between 1 and {MAX_NEAREST_K}"}), 400
+    if radius_nm is not None and radius_nm <= 0:
+        return jsonify({"error": "radius_nm must be positive"}), 400
+
+    airports = nearest_airports([lat], [lon], k, radius_nm)[0]
+    return jsonify({"count": len(airports), "airports": airports})
+
+
+@airport_bp.route("/quota", methods=["GET"])
+def checkwx_quota_status():
+    """
+    GET /api/airport/quota
+    Remaining CheckWX budget (shared by all workers), see checkwx_quota.py.
+    """
+    return jsonify(checkwx_quota.get_status())
+
+
+@airport_bp.route("/coord-cache", methods=["GET"])
+def coord_cache_stats():
+    """
+    GET /api/airport/coord-cache
+    Size and hit/miss counters of this worker's coordinate cache.
+    """
+    return jsonify(coord_cache.get_stats())
+
+
 @airport_bp.route("/<icao>", methods=["GET"])
 def get_airport(icao):
     """
@@ -18,42 +78,25 @@ def get_airport(icao):
     If not in DB => fetch from CheckWX => store as JSONB + top-level columns
     """
     icao = icao.strip().upper()
-    ap = Airport.query.get(icao)
-    if ap:
-        return jsonify(ap.to_dict())
-
-    # Not found => fetch from CheckWX
-    station_data = fetch_station_data_checkwx(icao)
-    if not station_data:
+    try:
+        ap = get_or_create_airport(icao)
+    except upstream.UpstreamUnavailable as e:
+        # CheckWX has been failing (or we're out of quota), don't make the client wait for another timeout
+        return unavailable_response(e)
+    if not ap:
         return jsonify({"error": f"No station data found for {icao}"}), 404
 
-    # Parse lat/lon from station_data
-    lat = station_data.get("latitude", {}).get("decimal")
-    lon = station_data.get("longitude", {}).get("decimal")
+    return jsonify(ap.to_dict())
 
-    # city might come from station_data["city"] or from station_data["location"] logic
-    city = station_data.get("city", "")
-    # Maybe parse country name (some data might be nested in station_data["country"]["name"])
-    country_obj = station_data.get("country", {})
-    country_name = country_obj.get("name", "")
 
-    iata = station_data.get("iata", "")
-    name = station_data.get("name", "")
-
-    new_ap = Airport(
-        icao=icao,
-        iata=iata,
-        name=name,
-        city=city,
-        country=country_name,
-        latitude=lat,
-        longitude=lon,
-        details=station_data  # store entire dictionary in JSONB
-    )
-    db.session.add(new_ap)
-    db.session.commit()
-
-    return jsonify(new_ap.to_dict())
+def unavailable_response(e: upstream.UpstreamUnavailable):
+    """
+    503 + Retry-After (the quota's refill time, or the breaker cooldown) for a CheckWX outage.
+    """
+    resp = jsonify({"error": str(e)})
+    retry_after = getattr(e, "retry_after", None) or upstream.UPSTREAM_BREAKER_COOLDOWN
+    resp.headers["Retry-After"] = str(int(retry_after))
+    return resp, 503
 
 
 @airport_bp.route("", methods=["GET"])
@@ -61,11 +104,48 @@ def list_airports():
     """
     GET /api/airport
     Return all airports in the DB
+
+    GET /api/airport?icao=ENGM,EGLL,...
+    Batch lookup instead, see batch_airports()
     """
+    if request.args.get("icao"):
+        return _batch_response(request.args["icao"].split(","))
+
     airports = Airport.query.all()
     results = [a.to_dict() for a in airports]
     return jsonify({"count": len(results), "airports": results})
 
+@airport_bp.route("/batch", methods=["POST"])
+def batch_airports():
+    """
+    POST /api/airport/batch
+    Same as GET /api/airport?icao=..., for longer lists:
+    { "icao": ["ENGM", "EGLL", ...] }
+
+    Resolves all codes with one DB query, fetches only the misses from CheckWX
+    (multi-station requests), and returns
+    { "count": 2, "airports": { "ENGM": {...}, "EGLL": {...} }, "missing": ["ZZZZ"] }
+    """
+    data = request.json or {}
+    codes = data.get("icao") if isinstance(data, dict) else data
+    if not isinstance(codes, list):
+        return jsonify({"error": "Expected {\"icao\": [...]}"}), 400
+    return _batch_response(codes)
+
+
+def _batch_response(codes):
+    icaos = normalize_icao_list(codes)
+    if not icaos:
+        return jsonify({"error": "Missing ICAO codes"}), 400
+    if len(icaos) > MAX_BATCH_ICAOS:
+        return jsonify({"error": f"At most {MAX_BATCH_ICAOS} ICAO codes per request"}), 400
+
+    found = resolve_airports(icaos)
+    airports = {icao: ap.to_dict() for icao, ap in found.items() if ap}
+    missing = [icao for icao in icaos if not found.get(icao)]
+    return jsonify({"count": len(airports), "airports": airports, "missing": missing})
+
+
 @airport_bp.route("", methods=["POST"])
 def create_airport():
     """
@@ -102,6 +182,7 @@ def create_airport():
         details=data.get("details")  # store entire dict if present
     )
     db.session.add(ap)
+    airport_misses.forget(icao)
     db.session.commit()
     return jsonify({"status": f"Created airport {icao}"}), 201
 
@@ -129,7 +210,9 @@ def update_airport(icao):
     if "details" in data:
         ap.details = data["details"]
 
+    airport_misses.forget(key)
     db.session.commit()
+    coord_cache.invalidate(key)
     return jsonify({"status": f"Airport {key} updated/created"})
 
 @airport_bp.route("/<icao>", methods=["DELETE"])
@@ -143,63 +226,130 @@ def delete_airport(icao):
         return jsonify({"error": f"No airport found for {key}"}), 404
     db.session.delete(ap)
     db.session.commit()
+    coord_cache.invalidate(key)
     return jsonify({"status": f"Airport {key} deleted."})
 
-def fetch_station_data_checkwx(icao: str):
+def fetch_station_data_checkwx(icao: str, priority: str = INTERACTIVE):
     """
-    Example usage: GET https://api.checkwx.com/station/{icao} with JSONB
+    Look up one station on CheckWX (GET /station/{icao}, batched with other
+    lookups by checkwx_scheduler.py). Returns the station record, or None if
+    not found or the call failed; "not found" is also recorded in the
+    negative cache (caller commits). Raises upstream.UpstreamUnavailable
+    while the CheckWX circuit is open or the quota is used up.
     """
-    url = f"https://api.checkwx.com/station/{icao}"
-    key = CHECKWX_API_KEY or ""
-    headers = {"X-API-Key": key}
-    print(f"[airport_routes] fetch_station_data_checkwx => {url}")
-    try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        arr = data.get("data", [])
-        if arr:
-            return arr[0]
-        return None
-    except requests.RequestException as e:
-        print(f"[airport_routes] CheckWX error: {e}")
-        return None
+    found = lookup_stations([icao], priority)
+    if icao in found and found[icao] is None:
+        airport_misses.record_miss(icao)
+    return found.get(icao)
 
 
-def fetch_or_get_airport_coords(icao: str) -> dict | None:
+def fetch_stations_checkwx(icaos, priority: str = INTERACTIVE) -> dict:
     """
-    Return {"lat": float, "lon": float} for the given ICAO.
-    1) Check if the Airport exists in DB. If so, return lat/lon if not None.
-    2) If not in DB, fetch from CheckWX, store in DB, then return lat/lon.
-    3) If can't fetch or no lat/lon, return None.
+    Multi-station lookup: GET https://api.checkwx.com/station/ENGM,EGLL,...
+    (in chunks of CHECKWX_BATCH_SIZE). Returns {ICAO: station_data} for the
+    stations CheckWX knows; failed chunks are logged and skipped.
+    Codes CheckWX answered "not found" for go to the negative cache (caller commits).
+    Raises upstream.UpstreamUnavailable while the CheckWX circuit is open or
+    the quota is used up.
     """
-    icao = icao.strip().upper()
-    ap = Airport.query.get(icao)
-    if ap:
-        # If we already have an airport, ensure lat/lon is present.
-        if ap.latitude is not None and ap.longitude is not None:
-            return {"lat": ap.latitude, "lon": ap.longitude}
-        # If we have the airport but lat/lon is missing, we might want to re-fetch or just return None
-        # For simplicity, let's just return None here
-        return None
+    stations = {}
+    for icao, station in lookup_stations(icaos, priority).items():
+        if station:
+            stations[icao] = station
+        else:
+            airport_misses.record_miss(icao)
+    return stations
 
-    # Not in DB => fetch from CheckWX
-    station_data = fetch_station_data_checkwx(icao)
-    if not station_data:
-        return None
 
+def normalize_icao_list(codes) -> list:
+    """
+    Strip/uppercase, drop blanks and duplicates (keeping order).
+    """
+    seen = set()
+    out = []
+    for code in codes:
+        if not isinstance(code, str):
+            continue
+        code = code.strip().upper()
+        if code and code not in seen:
+            seen.add(code)
+            out.append(code)
+    return out
+
+
+def resolve_airports(icaos, priority: str = INTERACTIVE) -> dict:
+    """
+    Return {ICAO: Airport or None} for many codes at once:
+    one `IN (...)` query, then a batched CheckWX lookup for just the misses
+    (with no transaction open), stored under the same advisory locks as
+    get_or_create_airport().
+    Malformed codes and known misses (negative cache) are never sent to CheckWX.
+    `priority` is the CheckWX budget class to spend (see checkwx_quota.py).
+    """
+    icaos = normalize_icao_list(icaos)
+    result = {icao: None for icao in icaos}
+    for ap in Airport.query.filter(Airport.icao.in_(icaos)).all():
+        result[ap.icao] = ap
+
+    misses = [icao for icao, ap in result.items() if ap is None and airport_misses.is_valid_icao(icao)]
+    if misses:
+        misses = sorted(set(misses) - airport_misses.known_misses(misses))
+    if not misses:
+        return result
+
+    try:
+        # The CheckWX lookup can queue behind other batches; don't hold a
+        # transaction (or any advisory lock) open while it does
+        db.session.commit()
+        stations = fetch_stations_checkwx(misses, priority)
+
+        if stations:
+            # Sorted lock order, so two batches can't deadlock each other
+            for icao in sorted(stations):
+                _lock_airport_key(icao)
+            # Re-check, other workers may have stored some while we were fetching
+            for ap in Airport.query.filter(Airport.icao.in_(list(stations))).all():
+                result[ap.icao] = ap
+            for icao, station_data in stations.items():
+                if icao in result and result[icao] is None:
+                    result[icao] = airport_from_station(icao, station_data)
+                    db.session.add(result[icao])
+        db.session.commit()
+    except upstream.UpstreamUnavailable as e:
+        db.session.rollback()
+        print(f"[airport_routes] resolve_airports: {e}, returning DB hits only")
+    except IntegrityError:
+        # Someone inserted some of these behind our back => just read them back
+        db.session.rollback()
+        for icao in misses:
+            result[icao] = None
+        for ap in Airport.query.filter(Airport.icao.in_(misses)).all():
+            result[ap.icao] = ap
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+def airport_from_station(icao: str, station_data: dict) -> Airport:
+    """
+    Build an (unsaved) Airport from a CheckWX station record:
+    top-level columns parsed out, the entire record kept in JSONB `details`.
+    """
+    # Parse lat/lon from station_data
     lat = station_data.get("latitude", {}).get("decimal")
     lon = station_data.get("longitude", {}).get("decimal")
-    if lat is None or lon is None:
-        return None
 
+    # city might come from station_data["city"] or from station_data["location"] logic
     city = station_data.get("city", "")
+    # Maybe parse country name (some data might be nested in station_data["country"]["name"])
     country_obj = station_data.get("country", {})
     country_name = country_obj.get("name", "")
+
     iata = station_data.get("iata", "")
     name = station_data.get("name", "")
 
-    new_ap = Airport(
+    return Airport(
         icao=icao,
         iata=iata,
         name=name,
@@ -207,9 +357,146 @@ def fetch_or_get_airport_coords(icao: str) -> dict | None:
         country=country_name,
         latitude=lat,
         longitude=lon,
-        details=station_data
+        details=station_data  # store entire dictionary in JSONB
     )
-    db.session.add(new_ap)
-    db.session.commit()
 
-    return {"lat": lat, "lon": lon}
\ No newline at end of file
+
+def _lock_airport_key(icao: str):
+    """
+    Cross-worker lock for one ICAO: a Postgres transaction-level advisory
+    lock, released by the next commit/rollback. No-op on other databases.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return
+    db.session.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+        {"key": f"airport:{icao}"}
+    )
+
+
+def _fetch_and_store_airport(icao: str):
+    """
+    Fetch `icao` from CheckWX, then insert it holding the advisory lock.
+    The CheckWX call runs with no transaction or lock held, so a slow batch
+    doesn't pin a DB connection or stall other requests for this ICAO.
+    Returns the Airport or None.
+    """
+    try:
+        db.session.commit()  # end the read transaction before waiting on CheckWX
+        station_data = fetch_station_data_checkwx(icao)
+        if not station_data:
+            db.session.commit()  # keeps the negative-cache row, if CheckWX said "no such station"
+            return None
+
+        _lock_airport_key(icao)
+        # Another worker may have stored it while we were fetching
+        ap = Airport.query.get(icao)
+        if ap:
+            db.session.commit()
+            return ap
+
+        ap = airport_from_station(icao, station_data)
+        db.session.add(ap)
+        db.session.commit()
+        return ap
+    except IntegrityError:
+        # Inserted behind our back (e.g. no advisory locks on this DB) => use that row
+        db.session.rollback()
+        return Airport.query.get(icao)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def get_or_create_airport(icao: str):
+    """
+    Return the Airport row for `icao`, fetching it from CheckWX on a miss.
+    Returns None if CheckWX has no such station (or the call failed).
+    Malformed codes and recent misses (airport_misses.py) return None without
+    calling CheckWX.
+
+    Concurrent misses for the same ICAO share a single CheckWX call:
+      - within this process, the first caller fetches and the rest wait on its Future,
+      - across workers, the insert runs under a Postgres advisory lock (the
+        CheckWX call itself runs outside it, see _fetch_and_store_airport).
+    Raises upstream.UpstreamUnavailable while the CheckWX circuit is open.
+    """
+    icao = icao.strip().upper()
+    ap = Airport.query.get(icao)
+    if ap:
+        return ap
+    if not airport_misses.is_valid_icao(icao) or airport_misses.is_known_miss(icao):
+        return None
+
+    with _inflight_lock:
+        fut = _inflight.get(icao)
+        is_leader = fut is None
+        if is_leader:
+            fut = _inflight[icao] = Future()
+
+    if not is_leader:
+        fut.result()  # re-raises whatever the leader ran into
+        return Airport.query.get(icao)
+
+    try:
+        ap = _fetch_and_store_airport(icao)
+        fut.set_result(None)
+        return ap
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(icao, None)
+
+
+def fetch_or_get_airport_coords_batch(icaos) -> dict:
+    """
+    Batch version of fetch_or_get_airport_coords():
+    {ICAO: {"lat": float, "lon": float}} for every code we have (or could
+    fetch) coordinates for; unknown codes are simply left out.
+    Only codes missing from the coordinate cache go to the DB.
+    """
+    coords = {}
+    misses = []
+    for icao in normalize_icao_list(icaos):
+        cached = coord_cache.get(icao)
+        if cached:
+            coords[icao] = {"lat": cached[0], "lon": cached[1]}
+        else:
+            misses.append(icao)
+    if not misses:
+        return coords
+
+    for icao, ap in resolve_airports(misses).items():
+        if ap and ap.latitude is not None and ap.longitude is not None:
+            coord_cache.put(icao, ap.latitude, ap.longitude, ap.name)
+            coords[icao] = {"lat": ap.latitude, "lon": ap.longitude}
+    return coords
+
+
+def fetch_or_get_airport_coords(icao: str) -> dict | None:
+    """
+    Return {"lat": float, "lon": float} for the given ICAO.
+    0) Check the process-local coordinate cache (no DB access on a hit).
+    1) Check if the Airport exists in DB. If so, return lat/lon if not None.
+    2) If not in DB, fetch from CheckWX, store in DB, then return lat/lon.
+    3) If CheckWX has no such station or no lat/lon, return None.
+    Raises upstream.UpstreamUnavailable while CheckWX is down or out of quota,
+    so callers can tell "unknown airport" from "can't look it up right now".
+    """
+    icao = icao.strip().upper()
+    cached = coord_cache.get(icao)
+    if cached:
+        return {"lat": cached[0], "lon": cached[1]}
+
+    ap = get_or_create_airport(icao)
+    if not ap:
+        return None
+
+    # If we have the airport but lat/lon is missing, we might want to re-fetch or just return None
+    # For simplicity, let's just return None here
+    if ap.latitude is None or ap.longitude is None:
+        return None
+    coord_cache.put(icao, ap.latitude, ap.longitude, ap.name)
+    return {"lat": ap.latitude, "lon": ap.longitude}
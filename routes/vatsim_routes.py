@@ -0,0 +1,39 @@
+# routes/vatsim_routes.py
+import requests
+from flask import Blueprint, jsonify, request
+import upstream
+from vatsim_summary import get_summary, get_pilot
+
+vatsim_bp = Blueprint('vatsim_bp', __name__)  # Will be registered at /api/vatsim
+
+
+@vatsim_bp.route("/summary", methods=["GET"])
+def vatsim_summary():
+    """
+    GET /api/vatsim/summary[?cid=908962]
+    Aggregated VATSIM stats (computed server-side from one feed fetch per minute).
+    With ?cid=, also includes that pilot (or prefile) as "pilot" and its "pilot_status".
+    """
+    try:
+        summary, stale = get_summary()
+    except upstream.UpstreamUnavailable as e:
+        resp = jsonify({"error": f"VATSIM feed unavailable: {e}"})
+        resp.headers["Retry-After"] = str(int(upstream.UPSTREAM_BREAKER_COOLDOWN))
+        return resp, 503
+    except requests.RequestException as e:
+        return jsonify({"error": f"VATSIM feed unavailable: {e}"}), 502
+    except Exception as e:
+        # Malformed feed (ValueError/KeyError/...) or a DB error while building the summary
+        print(f"[vatsim_routes] Summary failed: {e!r}")
+        return jsonify({"error": f"VATSIM feed unusable: {e}"}), 502
+
+    out = summary
+    cid = request.args.get("cid", None, int)
+    if cid is not None:
+        pilot, status = get_pilot(cid)
+        out = dict(summary, pilot=pilot, pilot_status=status)
+
+    resp = jsonify(out)
+    if stale:
+        resp.headers["Warning"] = upstream.STALE_WARNING
+    return resp
@@ -0,0 +1,186 @@
+"""
+solar.py
+
+Sunrise, sunset and twilight times computed locally (NOAA solar calculator
+equations), for any lat/lon and date, in the location's own timezone.
+
+A whole year is computed at once with numpy (one vectorised pass per event)
+and kept in a small LRU keyed by (lat, lon, tz, year), so /api/sun answers
+any airport and any date range without calling MET. Accuracy is within a
+minute or so of MET's Sunrise API away from the polar circles.
+
+Usage:
+    days = get_days(58.97, 5.73, "Europe/Oslo", date(2025, 1, 1), date(2025, 1, 31))
+    days[0]["sunrise"]  # "2025-01-01T09:29:00+01:00" (None if the sun doesn't rise)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# (lat, lon, tz, year) tables to keep around
+SOLAR_CACHE_SIZE = int(os.getenv("SOLAR_CACHE_SIZE", "64"))
+
+# Zenith angle (degrees) of each event; sunrise/sunset include refraction + the sun's radius
+ZENITHS = {
+    "sunrise": 90.833,
+    "civil": 96.0,
+    "nautical": 102.0,
+    "astronomical": 108.0
+}
+
+_cache = OrderedDict()  # (lat, lon, tz, year) -> {"YYYY-MM-DD": day}
+_cache_lock = threading.Lock()
+
+_UNIX_EPOCH_JD = 2440587.5
+
+
+def _sun_position(jd):
+    """
+    (declination in radians, equation of time in minutes) at Julian day(s) `jd`.
+    """
+    t = (jd - 2451545.0) / 36525.0
+    l0 = np.radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360)
+    m = np.radians(357.52911 + t * (35999.05029 - 0.0001537 * t))
+    e = 0.016708634 - t * (0.000042037 + 0.0000001267 * t)
+    c = (np.sin(m) * (1.914602 - t * (0.004817 + 0.000014 * t))
+         + np.sin(2 * m) * (0.019993 - 0.000101 * t)
+         + np.sin(3 * m) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * t)
+    app_long = np.radians(np.degrees(l0) + c - 0.00569 - 0.00478 * np.sin(omega))
+    obliq0 = 23 + (26 + (21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))) / 60) / 60
+    obliq = np.radians(obliq0 + 0.00256 * np.cos(omega))
+
+    decl = np.arcsin(np.sin(obliq) * np.sin(app_long))
+    y = np.tan(obliq / 2) ** 2
+    eot = 4 * np.degrees(
+        y * np.sin(2 * l0)
+        - 2 * e * np.sin(m)
+        + 4 * e * y * np.sin(m) * np.cos(2 * l0)
+        - 0.5 * y * y * np.sin(4 * l0)
+        - 1.25 * e * e * np.sin(2 * m)
+    )
+    return decl, eot
+
+
+def _event_minutes(jd0, lat, lon, zenith, rising: bool):
+    """
+    Minutes after 00:00 UTC of each day `jd0` at which the sun crosses `zenith`
+    (rising or setting). NaN where it doesn't happen that day.
+    Computed at solar noon first, then refined once at the estimated time.
+    """
+    lat_r = np.radians(lat)
+    cos_z = np.cos(np.radians(zenith))
+    sign = -1 if rising else 1
+
+    minutes = np.full(jd0.shape, 720.0 - 4 * lon)
+    for _ in range(2):
+        decl, eot = _sun_position(jd0 + minutes / 1440.0)
+        cos_ha = cos_z / (np.cos(lat_r) * np.cos(decl)) - np.tan(lat_r) * np.tan(decl)
+        with np.errstate(invalid="ignore"):
+            ha = np.degrees(np.arccos(cos_ha))  # NaN if |cos_ha| > 1 (polar day/night)
+        minutes = 720.0 - 4 * lon - eot + sign * 4 * ha
+    return minutes
+
+
+def _solar_noon_minutes(jd0, lon):
+    minutes = np.full(jd0.shape, 720.0 - 4 * lon)
+    for _ in range(2):
+        _, eot = _sun_position(jd0 + minutes / 1440.0)
+        minutes = 720.0 - 4 * lon - eot
+    return minutes
+
+
+def _local_iso(day: date, minutes, tz: ZoneInfo):
+    if np.isnan(minutes):
+        return None
+    utc = datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(minutes=round(float(minutes)))
+    return utc.astimezone(tz).isoformat(timespec="seconds")
+
+
+def _compute_year(lat: float, lon: float, tz_name: str, year: int) -> dict:
+    tz = ZoneInfo(tz_name)
+    days = np.arange(f"{year}-01-01", f"{year + 1}-01-01", dtype="datetime64[D]")
+    jd0 = days.astype("int64") + _UNIX_EPOCH_JD
+
+    events = {"solarnoon": _solar_noon_minutes(jd0, lon)}
+    for name, zenith in ZENITHS.items():
+        events[f"{name}_begin"] = _event_minutes(jd0, lat, lon, zenith, rising=True)
+        events[f"{name}_end"] = _event_minutes(jd0, lat, lon, zenith, rising=False)
+
+    table = {}
+    for i, d in enumerate(days.tolist()):
+        iso = {key: _local_iso(d, minutes[i], tz) for key, minutes in events.items()}
+        table[d.isoformat()] = {
+            "date": d.isoformat(),
+            "sunrise": iso["sunrise_begin"],
+            "sunset": iso["sunrise_end"],
+            "solarnoon": iso["solarnoon"],
+            "civil_twilight": {"begin": iso["civil_begin"], "end": iso["civil_end"]},
+            "nautical_twilight": {"begin": iso["nautical_begin"], "end": iso["nautical_end"]},
+            "astronomical_twilight": {"begin": iso["astronomical_begin"], "end": iso["astronomical_end"]}
+        }
+    return table
+
+
+def _year_table(lat: float, lon: float, tz_name: str, year: int) -> dict:
+    key = (round(lat, 4), round(lon, 4), tz_name, year)
+    with _cache_lock:
+        table = _cache.get(key)
+        if table is not None:
+            _cache.move_to_end(key)
+            return table
+
+    table = _compute_year(key[0], key[1], tz_name, year)
+    with _cache_lock:
+        _cache[key] = table
+        while len(_cache) > SOLAR_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return table
+
+
+def is_valid_timezone(tz_name: str) -> bool:
+    try:
+        ZoneInfo(tz_name)
+        return True
+    except (ValueError, KeyError):  # ZoneInfoNotFoundError is a KeyError
+        return False
+
+
+def get_days(lat: float, lon: float, tz_name: str, start: date, end: date) -> list:
+    """
+    One dict per day from `start` to `end` inclusive:
+      {"date", "sunrise", "sunset", "solarnoon",
+       "civil_twilight": {"begin", "end"}, "nautical_twilight": {...}, "astronomical_twilight": {...}}
+    Times are ISO strings in `tz_name` local time, None if the event doesn't
+    happen that day (midnight sun / polar night).
+    """
+    days = []
+    day = start
+    while day <= end:
+        table = _year_table(lat, lon, tz_name, day.year)
+        days.append(table[day.isoformat()])
+        day += timedelta(days=1)
+    return days
+
+
+def sun_feature(day: dict) -> dict:
+    """
+    One day in the shape of MET's Sunrise 3.0 "Feature", plus the twilight times.
+    """
+    return {
+        "type": "Feature",
+        "properties": {
+            "date": day["date"],
+            "sunrise": {"time": day["sunrise"]},
+            "sunset": {"time": day["sunset"]},
+            "solarnoon": {"time": day["solarnoon"]},
+            "civil_twilight": day["civil_twilight"],
+            "nautical_twilight": day["nautical_twilight"],
+            "astronomical_twilight": day["astronomical_twilight"]
+        }
+    }
@@ -0,0 +1,144 @@
+"""
+sun_table.py
+
+Pre-fetched MET sunrise/sunset times for a few named locations, indexed by
+date. /api/sun prefers these over the computed times (solar.py) for the
+dates they cover.
+
+Two sources, loaded lazily per (location, year) on the first lookup:
+
+  data/sun/<location>-<year>.json   written by fetch_sun_data.py:
+                                    {"location", "year", "tz", "lat", "lon", "start",
+                                     "sunrise": ["08:28", ...], "sunset": [...]}
+                                    local times, one per day from "start", null = no sunrise/sunset
+  sun_data.json, sun_data_2025.json  the original Stavanger files, a list of
+                                    {"date": "YYYY-MM-DD", "sunrise": "HH:MM", "sunset": "HH:MM"}
+                                    fetched with a fixed +01:00 offset; used for
+                                    DEFAULT_LOCATION years without an artifact
+
+Either way a lookup ends up as a dict hit on "YYYY-MM-DD".
+"""
+
+import json
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+SUN_DIR = Path(__file__).resolve().parent / "data" / "sun"
+LEGACY_SUN_DATA_FILES = ["sun_data.json", "sun_data_2025.json"]
+
+# name -> (lat, lon, IANA timezone); fetch_sun_data.py builds tables for these
+LOCATIONS = {
+    "stavanger": (58.970052, 5.733395, "Europe/Oslo"),
+    "oslo": (59.913868, 10.752245, "Europe/Oslo"),
+    "bergen": (60.391263, 5.322054, "Europe/Oslo"),
+    "trondheim": (63.430515, 10.395053, "Europe/Oslo"),
+    "tromso": (69.649205, 18.955324, "Europe/Oslo"),
+}
+# What /api/sun answers for without a location, and what the legacy files are for
+DEFAULT_LOCATION = "stavanger"
+
+# Times in the legacy files were fetched with a fixed offset, whatever the DST
+LEGACY_SUN_DATA_OFFSET = "+01:00"
+
+# Upper bound on days per /api/sun?from=&to= request
+MAX_RANGE_DAYS = 800
+
+_tables = {}  # (location, year) -> {"YYYY-MM-DD": {"date", "sunrise", "sunset"}} (ISO times)
+_legacy = None  # {"YYYY-MM-DD": {...}} from the legacy files, read once
+_tables_lock = threading.Lock()
+
+
+def artifact_path(location: str, year: int) -> Path:
+    return SUN_DIR / f"{location}-{year}.json"
+
+
+def _local_iso(date_str: str, hhmm: str | None, tz: ZoneInfo) -> str | None:
+    if not hhmm:
+        return None
+    local = datetime.fromisoformat(f"{date_str}T{hhmm}:00").replace(tzinfo=tz)
+    return local.isoformat(timespec="seconds")
+
+
+def _load_artifact(location: str, year: int) -> dict:
+    path = artifact_path(location, year)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[sun_table] Skipping {path.name}: {e}")
+        return {}
+
+    tz = ZoneInfo(doc["tz"])
+    start = date.fromisoformat(doc["start"])
+    table = {}
+    for i, (sunrise, sunset) in enumerate(zip(doc["sunrise"], doc["sunset"])):
+        key = (start + timedelta(days=i)).isoformat()
+        table[key] = {"date": key, "sunrise": _local_iso(key, sunrise, tz), "sunset": _local_iso(key, sunset, tz)}
+    print(f"[sun_table] Loaded {path.name} ({len(table)} days).")
+    return table
+
+
+def _load_legacy() -> dict:
+    tz = ZoneInfo(LOCATIONS[DEFAULT_LOCATION][2])
+    table = {}
+    for path in LEGACY_SUN_DATA_FILES:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[sun_table] Skipping {path}: {e}")
+            continue
+        for entry in entries:
+            times = {}
+            for field in ("sunrise", "sunset"):
+                stored = datetime.fromisoformat(f"{entry['date']}T{entry[field]}:00{LEGACY_SUN_DATA_OFFSET}")
+                times[field] = stored.astimezone(tz).isoformat(timespec="seconds")
+            table[entry["date"]] = {"date": entry["date"], **times}
+    print(f"[sun_table] Loaded {len(table)} days from the legacy files.")
+    return table
+
+
+def _table(location: str, year: int) -> dict:
+    global _legacy
+    key = (location, year)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is not None:
+            return table
+        table = _load_artifact(location, year)
+        if not table and location == DEFAULT_LOCATION:
+            if _legacy is None:
+                _legacy = _load_legacy()
+            prefix = f"{year}-"
+            table = {k: v for k, v in _legacy.items() if k.startswith(prefix)}
+        _tables[key] = table
+        return table
+
+
+def sun_feature(entry: dict) -> dict:
+    """
+    One day in the shape of MET's Sunrise 3.0 "Feature", in local (DST-aware) time.
+    """
+    return {
+        "type": "Feature",
+        "properties": {
+            "date": entry["date"],
+            "sunrise": {"time": entry["sunrise"]},
+            "sunset": {"time": entry["sunset"]}
+        }
+    }
+
+
+def get_day(date_str: str, location: str = DEFAULT_LOCATION) -> dict | None:
+    """
+    The entry for one "YYYY-MM-DD" date at `location`, or None if we have no data for it.
+    """
+    try:
+        year = int(date_str[:4])
+    except ValueError:
+        return None
+    return _table(location, year).get(date_str)
@@ -0,0 +1,196 @@
+"""
+upstream.py
+
+Shared HTTP client for every upstream integration (MET, hvakosterstrommen,
+aviationweather.gov, CheckWX, ...).
+
+Each named upstream gets its own requests.Session with a keep-alive
+connection pool, so warm calls skip the TCP+TLS handshake. All calls share
+the same timeout / retry policy and record per-upstream latency and error
+counters (see get_stats()).
+
+Retries happen in get() itself, one attempt at a time, so every failed
+attempt counts toward the breaker. Only fast failures are retried
+(connection refused/reset, 5xx); a timeout already cost UPSTREAM_TIMEOUT,
+so it's raised right away instead of being waited out again.
+
+Each upstream also has a circuit breaker: after UPSTREAM_BREAKER_FAILURES
+consecutive failures we stop calling it for UPSTREAM_BREAKER_COOLDOWN
+seconds and raise UpstreamUnavailable immediately, so an outage doesn't tie
+up every worker for the full timeout. After the cooldown one trial call is
+let through; success closes the breaker again.
+
+Usage:
+    import upstream
+    resp = upstream.get("met", url, headers=headers)
+"""
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Tunables (env overrides)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))        # seconds per attempt
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))           # retries on connection errors / 5xx (not timeouts)
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))       # 0.5s, 1s, 2s, ...
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "10"))      # keep-alive connections per host
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+UPSTREAM_BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))
+
+# Retried status codes. 429 is left out on purpose: it means "slow down",
+# and sleeping on Retry-After inside a request handler would stall the worker.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# `Warning` header value for responses served from a stale copy
+STALE_WARNING = '110 - "Response is Stale"'
+
+_sessions = {}   # upstream name -> requests.Session
+_stats = {}      # upstream name -> counters dict
+_breakers = {}   # upstream name -> {"failures": int, "open_until": float}
+_lock = threading.Lock()
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """
+    Raised (without any network call) while the breaker for an upstream is open.
+    """
+
+
+class UpstreamError(requests.RequestException):
+    """
+    The upstream answered, but with something we can't use (unexpected payload).
+    """
+
+
+def _new_session() -> requests.Session:
+    # No adapter-level retries, get() retries attempt by attempt
+    adapter = HTTPAdapter(
+        pool_connections=UPSTREAM_POOL_SIZE,
+        pool_maxsize=UPSTREAM_POOL_SIZE,
+        max_retries=0
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _session_for(name: str) -> requests.Session:
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = _new_session()
+            _breakers[name] = {"failures": 0, "open_until": 0.0}
+            _stats[name] = {
+                "requests": 0,
+                "errors": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "last_error": None
+            }
+        return session
+
+
+def _record(name: str, elapsed_ms: float, error: str | None):
+    with _lock:
+        s = _stats[name]
+        s["requests"] += 1
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+        if error:
+            s["errors"] += 1
+            s["last_error"] = error
+
+
+def _check_breaker(name: str):
+    with _lock:
+        breaker = _breakers[name]
+        now = time.monotonic()
+        if breaker["failures"] < UPSTREAM_BREAKER_FAILURES:
+            return
+        if now < breaker["open_until"]:
+            raise UpstreamUnavailable(f"{name} is unavailable (circuit open)")
+        # Half-open: let this call through as the trial, keep everyone else out meanwhile
+        breaker["open_until"] = now + UPSTREAM_BREAKER_COOLDOWN
+
+
+def _update_breaker(name: str, failed: bool):
+    with _lock:
+        breaker = _breakers[name]
+        if not failed:
+            breaker["failures"] = 0
+            return
+        breaker["failures"] += 1
+        if breaker["failures"] >= UPSTREAM_BREAKER_FAILURES:
+            if breaker["failures"] == UPSTREAM_BREAKER_FAILURES:
+                print(f"[upstream] {name}: {breaker['failures']} failures in a row, opening circuit.")
+            breaker["open_until"] = time.monotonic() + UPSTREAM_BREAKER_COOLDOWN
+
+
+def get(name: str, url: str, **kwargs) -> requests.Response:
+    """
+    GET `url` through the pooled session of upstream `name`.
+    Accepts the usual requests kwargs (params, headers, timeout, ...).
+    Raises requests.RequestException like requests.get does, and
+    UpstreamUnavailable (a RequestException) while the circuit is open.
+    A 5xx that's still there after the retries is returned, not raised
+    (callers use raise_for_status()).
+    """
+    kwargs.setdefault("timeout", UPSTREAM_TIMEOUT)
+    session = _session_for(name)
+
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        if attempt:
+            time.sleep(UPSTREAM_BACKOFF * 2 ** (attempt - 1))
+        # Checked per attempt, so our own retries stop once the circuit opens
+        _check_breaker(name)
+
+        start = time.perf_counter()
+        try:
+            resp = session.get(url, **kwargs)
+        except requests.RequestException as e:
+            _record(name, (time.perf_counter() - start) * 1000, str(e))
+            _update_breaker(name, failed=True)
+            if isinstance(e, requests.Timeout) or not isinstance(e, requests.ConnectionError) \
+                    or attempt == UPSTREAM_RETRIES:
+                raise
+            continue
+
+        # Only 5xx counts as the upstream failing; 4xx (e.g. 404 "not published") is a normal answer
+        error = f"HTTP {resp.status_code}" if resp.status_code >= 500 else None
+        _record(name, (time.perf_counter() - start) * 1000, error)
+        _update_breaker(name, failed=error is not None)
+        if resp.status_code not in RETRY_STATUSES or attempt == UPSTREAM_RETRIES:
+            return resp
+        resp.close()
+
+
+def get_stats() -> dict:
+    """
+    Return a snapshot of the per-upstream counters, e.g.
+    {"met": {"requests": 12, "errors": 0, "avg_ms": 85.2, "max_ms": 410.0,
+             "last_error": None, "circuit": "closed"}}
+    """
+    with _lock:
+        out = {}
+        now = time.monotonic()
+        for name, s in _stats.items():
+            breaker = _breakers[name]
+            if breaker["failures"] < UPSTREAM_BREAKER_FAILURES:
+                circuit = "closed"
+            elif now < breaker["open_until"]:
+                circuit = "open"
+            else:
+                circuit = "half-open"
+            out[name] = {
+                "requests": s["requests"],
+                "errors": s["errors"],
+                "avg_ms": round(s["total_ms"] / s["requests"], 1) if s["requests"] else None,
+                "max_ms": round(s["max_ms"], 1),
+                "last_error": s["last_error"],
+                "circuit": circuit
+            }
+        return out
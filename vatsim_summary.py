@@ -0,0 +1,297 @@
+"""
+vatsim_summary.py
+
+Server-side VATSIM aggregation for the dashboard.
+
+The VATSIM data feed is several MB. Instead of every browser downloading it
+each minute and crunching it client-side, we fetch it here at most once per
+REFRESH_SECONDS, compute the aggregates the VATSIM card shows, and serve
+that small summary to all clients:
+  - totals (clients / pilots / ATC),
+  - top airports by departures, with arrivals and aircraft on the ground,
+  - most popular aircraft families,
+  - the tracked ("favorite") airports,
+  - optionally a single pilot by CID (for the "my flight" tracker).
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import upstream
+from geo import distance_nm
+from routes.airport_routes import resolve_airports
+from checkwx_quota import BACKGROUND
+
+VATSIM_DATA_URL = "https://data.vatsim.net/v3/vatsim-data.json"
+
+# VATSIM regenerates the feed every ~15 s; the dashboard refreshes every 60 s
+REFRESH_SECONDS = 60
+
+TOP_AIRPORTS = 6
+TOP_AIRCRAFT = 5
+
+# "On ground" = within this radius of the airport and slow or low
+ON_GROUND_RADIUS_NM = 5
+ON_GROUND_MAX_GS_KT = 50
+ON_GROUND_MAX_ALT_FT = 2000
+
+TRACKED_AIRPORTS = [
+    {"icao": "ENGM", "name": "Oslo Gardermoen",    "lat": 60.202,  "lon": 11.083},
+    {"icao": "ENZV", "name": "Stavanger Sola",     "lat": 58.8765, "lon": 5.637},
+    {"icao": "KJFK", "name": "New York JFK",       "lat": 40.6398, "lon": -73.7789},
+    {"icao": "KEWR", "name": "Newark Liberty EWR", "lat": 40.6925, "lon": -74.1687},
+    {"icao": "KLGA", "name": "New York LaGuardia", "lat": 40.7772, "lon": -73.8726},
+    {"icao": "KPHL", "name": "Philadelphia PHL",   "lat": 39.8719, "lon": -75.2411},
+    {"icao": "KLAX", "name": "Los Angeles LAX",    "lat": 33.9425, "lon": -118.4081},
+]
+
+AIRCRAFT_FAMILIES = {
+    # ========== AIRBUS ==========
+    "A318": "Airbus A320", "A319": "Airbus A320", "A320": "Airbus A320", "A321": "Airbus A320",
+    "A20N": "Airbus A320neo", "A21N": "Airbus A320neo",
+    "A330": "Airbus A330", "A332": "Airbus A330", "A333": "Airbus A330",
+    "A338": "Airbus A330neo", "A339": "Airbus A330neo",
+    "A340": "Airbus A340", "A342": "Airbus A340", "A343": "Airbus A340",
+    "A345": "Airbus A340", "A346": "Airbus A340",
+    "A350": "Airbus A350", "A359": "Airbus A350", "A35K": "Airbus A350",
+    "A380": "Airbus A380",
+
+    # ========== BOEING ==========
+    "B707": "Boeing 707", "B717": "Boeing 717", "B727": "Boeing 727",
+    "B737": "Boeing 737", "B731": "Boeing 737", "B732": "Boeing 737", "B733": "Boeing 737",
+    "B734": "Boeing 737", "B735": "Boeing 737", "B736": "Boeing 737", "B738": "Boeing 737",
+    "B739": "Boeing 737",
+    "B37M": "Boeing 737 MAX", "B38M": "Boeing 737 MAX", "B39M": "Boeing 737 MAX",
+    "B747": "Boeing 747", "B741": "Boeing 747", "B742": "Boeing 747", "B743": "Boeing 747",
+    "B744": "Boeing 747", "B748": "Boeing 747",
+    "B757": "Boeing 757", "B752": "Boeing 757", "B753": "Boeing 757",
+    "B767": "Boeing 767", "B762": "Boeing 767", "B763": "Boeing 767", "B764": "Boeing 767",
+    "B777": "Boeing 777", "B772": "Boeing 777", "B773": "Boeing 777", "B77L": "Boeing 777",
+    "B77W": "Boeing 777",
+    "B787": "Boeing 787", "B788": "Boeing 787", "B789": "Boeing 787", "B78X": "Boeing 787",
+
+    # ========== EMBRAER ==========
+    "E170": "Embraer E-Jet", "E175": "Embraer E-Jet", "E190": "Embraer E-Jet", "E195": "Embraer E-Jet",
+    "E290": "Embraer E2", "E295": "Embraer E2",
+
+    # ========== BOMBARDIER ==========
+    "CRJ": "Bombardier CRJ", "CRJ1": "Bombardier CRJ", "CRJ2": "Bombardier CRJ",
+    "CRJ7": "Bombardier CRJ", "CRJ9": "Bombardier CRJ", "CRJX": "Bombardier CRJ",
+    "DH8A": "Bombardier Dash 8", "DH8B": "Bombardier Dash 8", "DH8C": "Bombardier Dash 8",
+    "DH8D": "Bombardier Dash 8",
+
+    # ========== ATR ==========
+    "AT42": "ATR 42", "AT43": "ATR 42", "AT45": "ATR 42", "AT46": "ATR 42", "AT72": "ATR 72",
+
+    # ========== MISC ==========
+    "CONC": "Concorde", "C130": "Lockheed C-130", "L101": "Lockheed L-1011 Tristar",
+    "MD11": "McDonnell Douglas MD-11",
+    "MD80": "McDonnell Douglas MD-80", "MD81": "McDonnell Douglas MD-80",
+    "MD82": "McDonnell Douglas MD-80", "MD83": "McDonnell Douglas MD-80",
+    "MD87": "McDonnell Douglas MD-80", "MD88": "McDonnell Douglas MD-80",
+    "MD90": "McDonnell Douglas MD-80",
+
+    # ========== COMAC ==========
+    "C919": "COMAC C919", "ARJ2": "COMAC ARJ21",
+}
+
+_summary = None        # last computed summary dict
+_pilots_by_cid = {}    # cid -> pilot dict (for the "my flight" lookup)
+_prefiles_by_cid = {}  # cid -> prefile dict
+_fetched_at = 0.0      # time.monotonic() of the last successful refresh
+_state_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def aircraft_family(acft_short):
+    """
+    Map an ICAO type (e.g. "B738") to a family name (e.g. "Boeing 737"),
+    falling back to the 3-letter prefix like the old client-side code.
+    """
+    if not acft_short or len(acft_short) < 3:
+        return acft_short or "Unknown"
+    code = acft_short.upper()
+    if code in AIRCRAFT_FAMILIES:
+        return AIRCRAFT_FAMILIES[code]
+    prefix = code[:3]
+    return AIRCRAFT_FAMILIES.get(prefix, prefix)
+
+
+def is_on_ground(pilot: dict, lat: float, lon: float) -> bool:
+    """
+    Same rule the dashboard used client-side: a zero (or missing) groundspeed,
+    altitude or position doesn't count, so the counts don't change with the move.
+    """
+    p_lat, p_lon = pilot.get("latitude"), pilot.get("longitude")
+    if not p_lat or not p_lon:
+        return False
+    if distance_nm(lat, lon, p_lat, p_lon) > ON_GROUND_RADIUS_NM:
+        return False
+    gs = pilot.get("groundspeed")
+    alt = pilot.get("altitude")
+    if gs and gs < ON_GROUND_MAX_GS_KT:
+        return True
+    return bool(alt) and alt < ON_GROUND_MAX_ALT_FT
+
+
+def _flight_plan_airports(pilot: dict):
+    fp = pilot.get("flight_plan") or {}
+    dep = (fp.get("departure") or "").strip().upper()
+    arr = (fp.get("arrival") or "").strip().upper()
+    return dep, arr
+
+
+def build_summary(data: dict) -> dict:
+    """
+    Compute the dashboard aggregates from a raw VATSIM v3 feed document.
+    Looks up coordinates of the top airports via the airport table
+    (so it needs an app context).
+    """
+    pilots = data.get("pilots") or []
+    general = data.get("general") or {}
+
+    # 1) Departures / arrivals for ALL airports
+    airport_stats = {}
+    for pilot in pilots:
+        dep, arr = _flight_plan_airports(pilot)
+        if dep:
+            airport_stats.setdefault(dep, {"departures": 0, "arrivals": 0})["departures"] += 1
+        if arr:
+            airport_stats.setdefault(arr, {"departures": 0, "arrivals": 0})["arrivals"] += 1
+
+    # 2) Top airports by departures, with on-ground counts
+    top = sorted(airport_stats.items(), key=lambda kv: kv[1]["departures"], reverse=True)[:TOP_AIRPORTS]
+    # One DB query + one CheckWX call for misses, paid from the background budget
+    known = resolve_airports([icao for icao, _ in top], priority=BACKGROUND)
+    top_airports = []
+    for icao, stats in top:
+        ap = known.get(icao)
+        on_ground = 0
+        if ap and ap.latitude is not None and ap.longitude is not None:
+            on_ground = sum(1 for p in pilots if is_on_ground(p, ap.latitude, ap.longitude))
+        top_airports.append({
+            "icao": icao,
+            "departures": stats["departures"],
+            "arrivals": stats["arrivals"],
+            "on_ground": on_ground
+        })
+
+    # 3) Most popular aircraft families
+    families = {}
+    for pilot in pilots:
+        short = (pilot.get("flight_plan") or {}).get("aircraft_short")
+        if not short:
+            continue
+        fam = aircraft_family(short)
+        families[fam] = families.get(fam, 0) + 1
+    aircraft = [
+        {"family": fam, "count": count}
+        for fam, count in sorted(families.items(), key=lambda kv: kv[1], reverse=True)[:TOP_AIRCRAFT]
+    ]
+
+    # 4) Tracked airports
+    favorites = []
+    for apt in TRACKED_AIRPORTS:
+        stats = airport_stats.get(apt["icao"], {"departures": 0, "arrivals": 0})
+        favorites.append({
+            "icao": apt["icao"],
+            "name": apt["name"],
+            "departures": stats["departures"],
+            "arrivals": stats["arrivals"],
+            "on_ground": sum(1 for p in pilots if is_on_ground(p, apt["lat"], apt["lon"]))
+        })
+
+    return {
+        "updated": general.get("update_timestamp"),
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "totals": {
+            "clients": general.get("connected_clients", 0),
+            "pilots": len(pilots),
+            "atc": len(data.get("controllers") or [])
+        },
+        "top_airports": top_airports,
+        "aircraft": aircraft,
+        "favorites": favorites
+    }
+
+
+def _refresh():
+    global _summary, _pilots_by_cid, _prefiles_by_cid, _fetched_at
+    resp = upstream.get("vatsim", VATSIM_DATA_URL)
+    resp.raise_for_status()
+    data = resp.json()
+
+    summary = build_summary(data)
+    pilots_by_cid = {p.get("cid"): p for p in data.get("pilots") or []}
+    prefiles_by_cid = {p.get("cid"): p for p in data.get("prefiles") or []}
+
+    with _state_lock:
+        _summary = summary
+        _pilots_by_cid = pilots_by_cid
+        _prefiles_by_cid = prefiles_by_cid
+        _fetched_at = time.monotonic()
+
+
+def get_summary():
+    """
+    Return (summary, is_stale).
+
+    Refreshes at most once per REFRESH_SECONDS: the first caller after expiry
+    fetches the feed, concurrent callers get the previous summary meanwhile
+    (or wait, if there is none yet). If the refresh fails, the previous summary
+    is returned as stale. Raises requests.RequestException if we have nothing.
+    """
+    with _state_lock:
+        summary = _summary
+        fresh = summary is not None and time.monotonic() - _fetched_at < REFRESH_SECONDS
+    if fresh:
+        return summary, False
+
+    # Someone else is refreshing and we have something to show => don't wait
+    if not _refresh_lock.acquire(blocking=summary is None):
+        return summary, False
+
+    try:
+        with _state_lock:
+            if _summary is not None and time.monotonic() - _fetched_at < REFRESH_SECONDS:
+                return _summary, False
+        _refresh()
+    except Exception as e:
+        if summary is None:
+            raise
+        print(f"[vatsim_summary] Refresh failed, serving previous summary: {e}")
+        return summary, True
+    finally:
+        _refresh_lock.release()
+
+    with _state_lock:
+        return _summary, False
+
+
+def get_pilot(cid: int):
+    """
+    Return (pilot_dict, status) for a CID from the last fetched feed:
+    "ONLINE" if flying, "PREFILED" if only a prefile exists (shaped like a
+    pilot without position), or (None, "OFFLINE").
+    """
+    with _state_lock:
+        pilot = _pilots_by_cid.get(cid)
+        prefile = _prefiles_by_cid.get(cid)
+
+    if pilot:
+        return pilot, "ONLINE"
+    if prefile:
+        return {
+            "cid": prefile.get("cid"),
+            "callsign": prefile.get("callsign"),
+            "flight_plan": prefile.get("flight_plan") or {},
+            # Prefile has no altitude/lat/lon
+            "latitude": None,
+            "longitude": None,
+            "altitude": 0,
+            "groundspeed": 0,
+            "vertical_speed": 0,
+            "heading": 0
+        }, "PREFILED"
+    return None, "OFFLINE"
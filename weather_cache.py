@@ -0,0 +1,251 @@
+"""
+weather_cache.py
+
+In-memory cache for MET Norway locationforecast/2.0 documents.
+
+MET asks clients to:
+  - use at most 4 decimals for lat/lon (their grid resolution),
+  - not re-fetch before the `Expires` header,
+  - revalidate with `If-Modified-Since` afterwards.
+
+So we key the cache on the snapped coordinates, serve from memory until
+`Expires`, and then send a conditional request. A 304 only bumps the expiry.
+
+After `Expires` the old document is still served (flagged as stale) while
+the revalidation runs in the background, so a slow or failing MET never
+blocks /api/weather when we have something to show.
+
+Every snapped coordinate a client asks for gets an entry, so the cache is an
+LRU bounded to FORECAST_CACHE_SIZE documents.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+import upstream
+
+FORECAST_URL = "https://api.met.no/weatherapi/locationforecast/2.0/complete"
+
+# If MET does not send a usable Expires header, keep the document this long.
+DEFAULT_TTL_SECONDS = 600
+
+# Past Expires we serve the old copy and refresh in the background for this
+# long; beyond that we try a blocking refresh first (stale copy on failure).
+MAX_STALE_SECONDS = 3 * 3600
+
+# Forecast documents kept per worker (least recently used ones are dropped)
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "256"))
+
+# (lat, lon) -> {"data": dict, "expires": datetime, "last_modified": str | None}, least recently used first
+_forecast_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# Keys with a background revalidation in flight
+_refreshing = set()
+
+
+def snap_coord(value) -> float:
+    """
+    Round a lat/lon value to MET's 4-decimal grid.
+    Raises ValueError if the value isn't a number.
+    """
+    return round(float(value), 4)
+
+
+def _parse_http_date(value):
+    if not value:
+        return None
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _expiry_from(resp, now):
+    expires = _parse_http_date(resp.headers.get("Expires"))
+    if expires is None or expires <= now:
+        return datetime.fromtimestamp(now.timestamp() + DEFAULT_TTL_SECONDS, tz=timezone.utc)
+    return expires
+
+
+def _revalidate(key, entry, headers: dict) -> dict:
+    """
+    Conditional (or plain, if we have nothing) GET for `key`; stores and
+    returns the new cache entry.
+    """
+    now = datetime.now(timezone.utc)
+    req_headers = dict(headers)
+    if entry and entry["last_modified"]:
+        req_headers["If-Modified-Since"] = entry["last_modified"]
+
+    resp = upstream.get(
+        "met",
+        FORECAST_URL,
+        params={"lat": f"{key[0]:.4f}", "lon": f"{key[1]:.4f}"},
+        headers=req_headers
+    )
+
+    if resp.status_code == 304 and entry:
+        new_entry = {
+            "data": entry["data"],
+            "expires": _expiry_from(resp, now),
+            "last_modified": resp.headers.get("Last-Modified", entry["last_modified"])
+        }
+    else:
+        resp.raise_for_status()
+        new_entry = {
+            "data": resp.json(),
+            "expires": _expiry_from(resp, now),
+            "last_modified": resp.headers.get("Last-Modified")
+        }
+
+    with _cache_lock:
+        _forecast_cache[key] = new_entry
+        _forecast_cache.move_to_end(key)
+        while len(_forecast_cache) > FORECAST_CACHE_SIZE:
+            _forecast_cache.popitem(last=False)
+    return new_entry
+
+
+def _background_revalidate(key, entry, headers: dict):
+    try:
+        _revalidate(key, entry, headers)
+    except requests.RequestException as e:
+        print(f"[weather_cache] Background refresh for {key} failed, keeping stale copy: {e}")
+    finally:
+        with _cache_lock:
+            _refreshing.discard(key)
+
+
+def get_forecast(lat, lon, headers: dict):
+    """
+    Return (document, is_stale) for (lat, lon).
+
+    - Fresh cache entry          => straight from memory.
+    - Expired, < MAX_STALE old   => the stale copy right away, refreshed in the background.
+    - Older / no entry           => (conditional) GET now; if that fails and we
+                                    have any copy at all, the stale copy.
+
+    The returned dict is shared with the cache, so callers must not mutate it.
+    Raises requests.RequestException if MET can't be reached and nothing is cached.
+    """
+    key = (snap_coord(lat), snap_coord(lon))
+    now = datetime.now(timezone.utc)
+
+    with _cache_lock:
+        entry = _forecast_cache.get(key)
+        if entry:
+            _forecast_cache.move_to_end(key)
+        if entry and entry["expires"] > now:
+            return entry["data"], False
+
+        if entry and (now - entry["expires"]).total_seconds() < MAX_STALE_SECONDS:
+            if key not in _refreshing:
+                _refreshing.add(key)
+                threading.Thread(
+                    target=_background_revalidate,
+                    args=(key, entry, headers),
+                    name="forecast-refresh",
+                    daemon=True
+                ).start()
+            return entry["data"], True
+
+    try:
+        return _revalidate(key, entry, headers)["data"], False
+    except requests.RequestException:
+        if entry:
+            return entry["data"], True
+        raise
+
+
+def _filter_details(details: dict, fields):
+    if fields is None:
+        return dict(details)
+    return {k: v for k, v in details.items() if k in fields}
+
+
+def project_forecast(doc: dict, fields=None, hours=None) -> dict:
+    """
+    Return a trimmed copy of a locationforecast document, same shape as MET's:
+      - `fields`: set of variable names to keep in instant/next_N_hours details
+                  (and in meta.units). "symbol_code" keeps the summaries.
+                  None keeps everything.
+      - `hours`:  only keep the timeseries entries for the next this many hours,
+                  starting with the current one (a stale document may start in the past).
+    The cached document itself is never modified.
+    """
+    props = doc.get("properties", {})
+    timeseries = props.get("timeseries", [])
+
+    if hours is not None and timeseries:
+        now = datetime.now(timezone.utc).timestamp()
+        # The entry for the hour we're in is still current, earlier ones aren't
+        start = now - now % 3600
+        cutoff = start + hours * 3600
+        timeseries = [
+            ts for ts in timeseries
+            if start <= datetime.fromisoformat(ts["time"].replace("Z", "+00:00")).timestamp() < cutoff
+        ]
+
+    keep_summary = fields is None or "symbol_code" in fields
+    out_series = []
+    for ts in timeseries:
+        data = {}
+        for period, block in ts.get("data", {}).items():
+            new_block = {}
+            if "details" in block:
+                details = _filter_details(block["details"], fields)
+                if details:
+                    new_block["details"] = details
+            if keep_summary and "summary" in block:
+                new_block["summary"] = block["summary"]
+            if new_block or period == "instant":
+                data[period] = new_block
+        out_series.append({"time": ts["time"], "data": data})
+
+    meta = dict(props.get("meta", {}))
+    if "units" in meta:
+        meta["units"] = _filter_details(meta["units"], fields)
+
+    out = {k: v for k, v in doc.items() if k != "properties"}
+    out["properties"] = {"meta": meta, "timeseries": out_series}
+    return out
+
+
+def compact_forecast(doc: dict, fields=None, hours=None) -> dict:
+    """
+    Flattened form of project_forecast(): one small row per timestep, e.g.
+      {"time": "...", "air_temperature": 4.1, "wind_speed": 3.2,
+       "precipitation_amount_1h": 0.0, "symbol_code_1h": "cloudy", ...}
+    Period variables get a _1h/_6h/_12h suffix.
+    """
+    projected = project_forecast(doc, fields, hours)
+    props = projected["properties"]
+
+    rows = []
+    for ts in props["timeseries"]:
+        row = {"time": ts["time"]}
+        for period, block in ts["data"].items():
+            if period == "instant":
+                row.update(block.get("details", {}))
+                continue
+            # "next_6_hours" -> "_6h"
+            suffix = "_" + period.replace("next_", "").replace("_hours", "h")
+            for k, v in block.get("details", {}).items():
+                row[k + suffix] = v
+            if "summary" in block:
+                row["symbol_code" + suffix] = block["summary"].get("symbol_code")
+        rows.append(row)
+
+    return {
+        "updated_at": props["meta"].get("updated_at"),
+        "units": props["meta"].get("units", {}),
+        "timeseries": rows
+    }